@@ -0,0 +1,2 @@
+from .synthetic import SyntheticSpec, write_autograder, write_moodle_zip
+from .run import Benchmark, run, compare
@@ -0,0 +1,97 @@
+import json
+import sys
+import time
+
+from pathlib import Path
+
+import click
+
+from .run import STAGES, run, compare, write
+from .importtime import IMPORT_BUDGET_SECONDS, measure
+from .synthetic import SyntheticSpec
+
+@click.group()
+def cli():
+    """
+    Benchmarks of the ograder grading pipeline on synthetic Moodle downloads.
+    """
+    pass
+
+@click.command()
+@click.option('-n', '--students', default=50, show_default=True, type=int, help='number of students.')
+@click.option('-q', '--questions', default=3, show_default=True, type=int, help='number of questions of the autograder.')
+@click.option('-c', '--cells', default=20, show_default=True, type=int, help='number of filler cells of each notebook.')
+@click.option('-f', '--files_per_student', default=1, show_default=True, type=int, help='1: each student submits a zip file, otherwise the notebook and files_per_student-1 data files.')
+@click.option('--timeout_share', default=0.0, show_default=True, type=float, help='share of notebooks which run into the timeout.')
+@click.option('--exception_share', default=0.0, show_default=True, type=float, help='share of notebooks which raise an exception.')
+@click.option('--invalid_share', default=0.0, show_default=True, type=float, help='share of invalid submissions (broken notebook, syntax errors, unchanged template, no notebook).')
+@click.option('--seed', default=0, show_default=True, type=int, help='seed of the generator.')
+@click.option('-s', '--samples', default=5, show_default=True, type=int, help='number of submissions graded sequentially in the grade stage.')
+@click.option('-t', '--timeout', default=30, show_default=True, type=float, help='grading timeout in seconds of the end-to-end stage.')
+@click.option('-j', '--jobs', default=None, type=int, help='number of submissions graded in parallel in the end-to-end stage  [default: number of usable cores]')
+@click.option('--stage', 'stages', multiple=True, type=click.Choice(STAGES), help='stage to run, can be repeated  [default: all]')
+@click.option('-w', '--work_dir', default=None, type=click.Path(file_okay=False), help='keep all generated files in this directory.')
+@click.option('-o', '--output', default=None, type=click.Path(dir_okay=False), help='result file  [default: benchmark_<timestamp>.json]')
+def bench(students: int, questions: int, cells: int, files_per_student: int, timeout_share: float, exception_share: float, invalid_share: float, seed: int, samples: int, timeout: float, jobs: int, stages: list[str], work_dir: str, output: str):
+    """
+    Generates a synthetic Moodle download and measures the throughput of each grading stage and of the whole grading.
+    """
+    spec = SyntheticSpec(students=students, questions=questions, cells=cells, files_per_student=files_per_student,
+                         timeout_share=timeout_share, exception_share=exception_share, invalid_share=invalid_share, sleep_seconds=max(3600, 10 * timeout), seed=seed)
+    result = run(spec, work_dir, samples=samples, timeout=timeout, jobs=jobs, stages=list(stages) if len(stages) > 0 else None)
+    output = Path(output) if output != None else Path(f'benchmark_{time.strftime("%Y%m%d_%H%M%S")}.json')
+    write(result, output)
+    for stage, measurement in result['stages'].items():
+        throughput = measurement['items_per_second']
+        click.echo(f'{stage:>12}: {measurement["seconds"]:10.3f} s  {measurement["items"]:6d} items  ' + (f'{throughput:10.2f} items/s' if throughput != None else ''))
+    if 'saved_seconds' in result['stages'].get('prescreen', {}):
+        click.echo(f'pre-screening rejected {result["stages"]["prescreen"]["rejected"]} submissions and saved about {result["stages"]["prescreen"]["saved_seconds"]:.1f} s of grading')
+    click.echo(f'written {output}')
+
+@click.command('compare')
+@click.option('--threshold', default=0.1, show_default=True, type=float, help='relative loss of throughput which is reported as regression.')
+@click.argument('baseline', type=click.Path(exists=True, dir_okay=False))
+@click.argument('current', type=click.Path(exists=True, dir_okay=False))
+def compare_command(threshold: float, baseline: str, current: str):
+    """
+    Compares two benchmark results and exits with status 1 if a stage regressed.
+    """
+    with open(baseline) as f:
+        baseline_result = json.load(f)
+    with open(current) as f:
+        current_result = json.load(f)
+    regressions = 0
+    for stage, old, new, regressed in compare(baseline_result, current_result, threshold):
+        ratio = f'{new / old:6.2f}x' if old and new else '     -'
+        click.echo(f'{stage:>12}: {old or 0:10.2f} -> {new or 0:10.2f} items/s  {ratio}' + ('  REGRESSION' if regressed else ''))
+        regressions += int(regressed)
+    sys.exit(1 if regressions > 0 else 0)
+
+@click.command()
+@click.option('-m', '--module', default='ograder.cli', show_default=True, type=str, help='module whose import is measured.')
+@click.option('-r', '--runs', default=5, show_default=True, type=int, help='number of fresh interpreters, the fastest one is reported.')
+@click.option('-b', '--budget', default=IMPORT_BUDGET_SECONDS, show_default=True, type=float, help='maximum import time in seconds.')
+def importtime(module: str, runs: int, budget: float):
+    """
+    Measures the import time of the command line interface (python -X importtime) and exits with status 1
+    if it exceeds the budget or if a heavy dependency (otter, pandas, ...) is imported.
+    """
+    result = measure(module, runs)
+    click.echo(f'{module}: {result["seconds"] * 1000:.1f} ms ({result["modules"]} modules), budget {budget * 1000:.0f} ms')
+    for entry in result['slowest']:
+        click.echo(f'  {entry["module"]:<40} {entry["cumulative_seconds"] * 1000:8.1f} ms')
+    failed = False
+    if len(result['heavy_modules']) > 0:
+        click.echo(f'heavy modules are imported: {", ".join(result["heavy_modules"])}', err=True)
+        failed = True
+    if result['seconds'] > budget:
+        click.echo(f'the import takes longer than {budget * 1000:.0f} ms', err=True)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+cli.add_command(bench)
+cli.add_command(compare_command)
+cli.add_command(importtime)
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,58 @@
+import re
+import subprocess
+import sys
+
+IMPORT_BUDGET_SECONDS = 0.25 # cumulative import time of ograder.cli
+HEAVY_MODULES = ['otter', 'pandas', 'numpy', 'matplotlib', 'nbformat', 'nbconvert', 'openai', 'jupyter_client']
+
+_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+def parse(stderr: str) -> list[tuple[str, int, int, int]]:
+    """
+    Parses the output of python -X importtime.
+
+    Returns:
+        list[tuple[str, int, int, int]]: (module, self microseconds, cumulative microseconds, nesting level) of each imported module
+    """
+    modules = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match != None:
+            modules.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return modules
+
+def measure(module: str='ograder.cli', runs: int=5, top: int=10) -> dict:
+    """
+    Measures the import time of module in fresh interpreters (python -X importtime), the fastest of runs is reported.
+
+    Args:
+        module (str, optional): module to import
+        runs (int, optional): number of interpreters started
+        top (int, optional): number of modules with the largest cumulative time which are reported
+
+    Returns:
+        dict: the cumulative import time of module in seconds, the modules it imported which take the most time and the heavy modules (see HEAVY_MODULES) among them
+    """
+    best = None
+    for _ in range(max(1, runs)):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True, check=True)
+        modules = parse(process.stderr)
+        seconds = next(cumulative for name, _, cumulative, _ in reversed(modules) if name == module) / 1e6
+        if best == None or seconds < best[0]:
+            best = (seconds, modules)
+    seconds, modules = best
+    # the output lists the imports of a module (deeper nested) right before the module itself
+    end = max(i for i, m in enumerate(modules) if m[0] == module)
+    start = end
+    while start > 0 and modules[start - 1][3] > modules[end][3]:
+        start -= 1
+    modules = modules[start:end]
+    slowest = sorted(modules, key=lambda m: -m[2])[:top]
+    heavy = sorted({name.split('.')[0] for name, *_ in modules if name.split('.')[0] in HEAVY_MODULES})
+    return {
+        'module': module,
+        'seconds': seconds,
+        'modules': len(modules),
+        'slowest': [{'module': name, 'self_seconds': own / 1e6, 'cumulative_seconds': cumulative / 1e6} for name, own, cumulative, _ in slowest],
+        'heavy_modules': heavy,
+    }
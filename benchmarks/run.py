@@ -0,0 +1,208 @@
+import json
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+from pathlib import Path
+
+import otter
+
+from ograder.cache import content_hash
+from ograder.local_grader import LocalGrader, Student, Question, ScoreMatrix
+from ograder.prescreen import prescreen_all, code_sources
+from ograder.results import ResultWriter
+from ograder.utils import cpu_count
+from ograder.version import __version__
+
+from .synthetic import SyntheticSpec, write_autograder, write_moodle_zip, make_template
+
+STAGES = ['hash', 'prescreen', 'grade', 'results', 'end_to_end']
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=Path(__file__).parent, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment() -> dict:
+    """
+    Returns:
+        dict: versions and machine information which are required to compare benchmark results
+    """
+    return {
+        'ograder_version': __version__,
+        'otter_version': otter.__version__,
+        'git_commit': _git_commit(),
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': cpu_count(),
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+def _stage(seconds: float, items: int, **extra) -> dict:
+    return dict(seconds=seconds, items=items, items_per_second=(items / seconds if seconds > 0 else None), **extra)
+
+class Benchmark:
+
+    def __init__(self, spec: SyntheticSpec, work_dir: Path):
+        """
+        Measures the throughput of the grading pipeline, i.e., of each stage separately and of LocalGrader.grade as a whole,
+        on a synthetic Moodle download described by spec.
+
+        Args:
+            spec (SyntheticSpec): parameters of the synthetic Moodle download
+            work_dir (Path): directory to which the download, the autograder and all grading results are written
+        """
+        self.spec = spec
+        self.work_dir = Path(work_dir)
+        self.autograder_dir = self.work_dir / 'autograder'
+        self.submission_dir = self.work_dir / 'submission'
+        self.autograder_zip = self.autograder_dir / 'bench-autograder.zip'
+        self.moodle_zip = self.submission_dir / 'moodle.zip'
+        self.kinds: dict[str, str] = {}
+        self.students: list[Student] = []
+
+    def generate(self) -> dict:
+        start = time.perf_counter()
+        write_autograder(self.autograder_zip, self.spec.questions)
+        self.kinds = {student_dir.split(' ')[0]: kind for student_dir, kind in write_moodle_zip(self.moodle_zip, self.spec).items()}
+        return _stage(time.perf_counter() - start, self.spec.students, bytes=self.moodle_zip.stat().st_size)
+
+    def parse(self) -> dict:
+        """Splits the Moodle download into the otter zip files of the students."""
+        parse_dir = self.work_dir / 'parse'
+        parse_dir.mkdir()
+        grader = LocalGrader(self.autograder_dir, self.submission_dir)
+        start = time.perf_counter()
+        self.students = grader._LocalGrader__pase_moodle_zip(self.moodle_zip, parse_dir)
+        seconds = time.perf_counter() - start
+        for student in self.students:
+            student.file = parse_dir / student.file
+        return _stage(seconds, len(self.students), bytes=self.moodle_zip.stat().st_size)
+
+    def hash(self) -> dict:
+        """Computes the content hash of each otter zip file (the key of the result cache)."""
+        start = time.perf_counter()
+        for student in self.students:
+            content_hash(student.file)
+        content_hash(self.autograder_zip)
+        return _stage(time.perf_counter() - start, len(self.students))
+
+    def prescreen(self, jobs: int=None) -> dict:
+        """Checks every otter zip file without executing it (against the synthetic template) and counts the findings by reason."""
+        template = code_sources(make_template(self.spec))
+        start = time.perf_counter()
+        findings = prescreen_all([student.file for student in self.students], template, jobs)
+        seconds = time.perf_counter() - start
+        reasons = {}
+        for finding in findings:
+            if finding != None:
+                reasons[finding.code] = reasons.get(finding.code, 0) + 1
+        return _stage(seconds, len(self.students), rejected=sum(reasons.values()), reasons=reasons)
+
+    def grade_sequential(self, samples: int) -> dict:
+        """Grades the first samples regular submissions one after another in this process, i.e., without worker pool."""
+        regular = [student for student in self.students if self.kinds.get(student.name) == 'regular'][:samples]
+        phases = {}
+        start = time.perf_counter()
+        for student in regular:
+            _, timings, _ = LocalGrader.run_grade_submission(str(student.file), str(self.autograder_zip), True, False)
+            for phase, seconds in timings.items():
+                phases[phase] = phases.get(phase, 0.0) + seconds
+        return _stage(time.perf_counter() - start, len(regular), phase_seconds=phases)
+
+    def write_results(self, rows: int) -> dict:
+        """Writes rows random results by the ResultWriter, including the final sort by the ScoreMatrix."""
+        rng = random.Random(self.spec.seed)
+        questions = [f'q{i}' for i in range(1, self.spec.questions+1)]
+        students = [Student(f'Student{i}', 'Synthetic', {q: Question(q, float(rng.random() < 0.5), 1.0) for q in questions}, Path(f'Student{i}_Synthetic.zip')) for i in range(rows)]
+        start = time.perf_counter()
+        with ResultWriter(self.work_dir / 'results.csv', questions) as writer:
+            for student in students:
+                writer.write(student)
+            writer.close(ScoreMatrix.from_students(students, questions))
+        return _stage(time.perf_counter() - start, rows)
+
+    def end_to_end(self, timeout: float, jobs: int) -> dict:
+        """Runs LocalGrader.grade on the whole Moodle download without the result cache."""
+        grader = LocalGrader(self.autograder_dir, self.submission_dir)
+        start = time.perf_counter()
+        grader.grade(timeount_in_seconds=timeout, jobs=jobs, use_cache=False)
+        seconds = time.perf_counter() - start
+        grading_dir = max(self.submission_dir.glob('grading_*'))
+        summary_path = next(grading_dir.glob('grading_timing_summary_*.json'), None)
+        timing_summary = json.loads(summary_path.read_text()) if summary_path != None else None
+        return _stage(seconds, self.spec.students, timing_summary=timing_summary)
+
+def run(spec: SyntheticSpec, work_dir: Path=None, samples: int=5, timeout: float=30, jobs: int=None, stages: list[str]=None) -> dict:
+    """
+    Runs the benchmark and returns its result.
+
+    Args:
+        spec (SyntheticSpec): parameters of the synthetic Moodle download
+        work_dir (Path, optional): directory for all generated files, if None, a temporary directory is used and removed afterwards
+        samples (int, optional): number of submissions graded sequentially in the grade stage
+        timeout (float, optional): grading timeout in seconds of the end-to-end stage
+        jobs (int, optional): number of submissions graded in parallel in the end-to-end stage
+        stages (list[str], optional): names of the stages to run (generate and parse always run), if None, all stages are run
+
+    Returns:
+        dict: the environment, the parameters and for each stage its duration and throughput
+    """
+    stages = STAGES if stages == None else stages
+    cleanup = work_dir == None
+    work_dir = Path(tempfile.mkdtemp(prefix='ograder_bench_')) if cleanup else Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        benchmark = Benchmark(spec, work_dir)
+        result = {'environment': environment(), 'spec': spec.to_dict(), 'params': {'samples': samples, 'timeout': timeout, 'jobs': jobs}, 'stages': {}}
+        result['stages']['generate'] = benchmark.generate()
+        result['stages']['parse'] = benchmark.parse()
+        if 'hash' in stages:
+            result['stages']['hash'] = benchmark.hash()
+        if 'prescreen' in stages:
+            result['stages']['prescreen'] = benchmark.prescreen(jobs)
+        if 'grade' in stages:
+            result['stages']['grade'] = benchmark.grade_sequential(samples)
+        if 'prescreen' in stages and 'grade' in stages and result['stages']['grade']['items'] > 0:
+            # every rejected submission would have cost (at least) the grading of a regular submission
+            grade = result['stages']['grade']
+            result['stages']['prescreen']['saved_seconds'] = result['stages']['prescreen']['rejected'] * grade['seconds'] / grade['items'] - result['stages']['prescreen']['seconds']
+        if 'results' in stages:
+            result['stages']['results'] = benchmark.write_results(spec.students)
+        if 'end_to_end' in stages:
+            result['stages']['end_to_end'] = benchmark.end_to_end(timeout, jobs)
+        return result
+    finally:
+        if cleanup:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+def compare(baseline: dict, current: dict, threshold: float=0.1) -> list[tuple[str, float, float, bool]]:
+    """
+    Compares the throughput of each stage of two benchmark results.
+
+    Args:
+        baseline (dict): result of the older version
+        current (dict): result of the newer version
+        threshold (float, optional): relative loss of throughput which is considered as regression
+
+    Returns:
+        list[tuple[str, float, float, bool]]: for each stage which is part of both results, its name, the throughput of both results and whether it regressed
+    """
+    rows = []
+    for stage, measurement in current['stages'].items():
+        if stage not in baseline['stages']:
+            continue
+        old, new = baseline['stages'][stage]['items_per_second'], measurement['items_per_second']
+        regressed = old != None and new != None and new < old * (1 - threshold)
+        rows.append((stage, old, new, regressed))
+    return rows
+
+def write(result: dict, path: Path) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
@@ -0,0 +1,161 @@
+import io
+import json
+import random
+import zipfile
+
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+import nbformat
+
+ASSIGNMENT_NAME = 'bench'
+NOTEBOOK_NAME = f'{ASSIGNMENT_NAME}.ipynb'
+
+@dataclass
+class SyntheticSpec:
+    """Parameters of a synthetic Moodle download."""
+    students: int = 50
+    questions: int = 3
+    cells: int = 20
+    files_per_student: int = 1
+    timeout_share: float = 0.0
+    exception_share: float = 0.0
+    invalid_share: float = 0.0
+    correct_share: float = 0.7
+    sleep_seconds: float = 3600
+    seed: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+TEST_TEMPLATE = '''from otter.test_files import test_case
+
+OK_FORMAT = False
+
+name = "q{i}"
+points = 1
+
+@test_case(points=None, hidden=False)
+def test_x{i}(x{i}):
+    assert x{i} == {i}
+'''
+
+def write_autograder(path: Path, questions: int) -> Path:
+    """
+    Writes a minimal otter autograder zip file which tests the variables x1, ..., xn for the value of their index,
+    i.e., question qi is correct if xi == i.
+
+    Args:
+        path (Path): path of the autograder zip file
+        questions (int): number of questions
+
+    Returns:
+        Path: path of the autograder zip file
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('otter_config.json', json.dumps({'zips': True, 'lang': 'python'}, indent=2))
+        for i in range(1, questions+1):
+            zf.writestr(f'tests/q{i}.py', TEST_TEMPLATE.format(i=i))
+    return path
+
+def make_notebook(spec: SyntheticSpec, rng: random.Random, timeout=False, exception=False) -> nbformat.NotebookNode:
+    """
+    Constructs a student notebook which answers each question correctly with probability spec.correct_share.
+    Its size is controlled by spec.cells, i.e., the number of cheap filler cells between the answers.
+
+    Args:
+        spec (SyntheticSpec): parameters of the download
+        rng (random.Random): random number generator
+        timeout (bool, optional): if True, the notebook sleeps for spec.sleep_seconds
+        exception (bool, optional): if True, the notebook raises an exception
+
+    Returns:
+        nbformat.NotebookNode: the notebook
+    """
+    nb = nbformat.v4.new_notebook()
+    nb.metadata['kernelspec'] = {'name': 'python3', 'display_name': 'Python 3', 'language': 'python'}
+    cells = []
+    for i in range(1, spec.questions+1):
+        cells.append(nbformat.v4.new_markdown_cell(f'**Question {i}:** assign {i} to `x{i}`.'))
+        cells.append(nbformat.v4.new_code_cell(f'x{i} = {i if rng.random() < spec.correct_share else -i}'))
+    for j in range(spec.cells):
+        cells.insert(rng.randrange(len(cells)+1), nbformat.v4.new_code_cell(f'filler_{j} = sum(range({rng.randrange(1000, 10000)}))'))
+    if timeout:
+        cells.insert(rng.randrange(len(cells)+1), nbformat.v4.new_code_cell(f'import time\ntime.sleep({spec.sleep_seconds})'))
+    if exception:
+        cells.insert(rng.randrange(len(cells)+1), nbformat.v4.new_code_cell('raise RuntimeError("synthetic failure")'))
+    nb.cells = cells
+    return nb
+
+INVALID_KINDS = ['broken_json', 'syntax_errors', 'empty_template', 'no_notebook']
+
+def make_template(spec: SyntheticSpec) -> nbformat.NotebookNode:
+    """
+    Constructs the student notebook handed out, i.e., the questions with unanswered code cells.
+    """
+    nb = nbformat.v4.new_notebook()
+    nb.metadata['kernelspec'] = {'name': 'python3', 'display_name': 'Python 3', 'language': 'python'}
+    for i in range(1, spec.questions+1):
+        nb.cells.append(nbformat.v4.new_markdown_cell(f'**Question {i}:** assign {i} to `x{i}`.'))
+        nb.cells.append(nbformat.v4.new_code_cell(f'x{i} = ...'))
+    return nb
+
+def _invalid_content(spec: SyntheticSpec, rng: random.Random, kind: str) -> str:
+    if kind == 'broken_json':
+        content = nbformat.writes(make_notebook(spec, rng))
+        return content[:len(content) // 2]
+    if kind == 'syntax_errors':
+        nb = make_template(spec)
+        for cell in nb.cells:
+            if cell.cell_type == 'code':
+                cell.source = cell.source.replace('...', '= ...')
+        return nbformat.writes(nb)
+    return nbformat.writes(make_template(spec))
+
+def write_moodle_zip(path: Path, spec: SyntheticSpec) -> dict[str, str]:
+    """
+    Writes a synthetic Moodle download, i.e., one directory '<Name> <Forname>_<id>_assignsubmission_file_' per student.
+    If spec.files_per_student is 1, the directory contains a zip file with the notebook (the default case),
+    otherwise it contains the notebook and spec.files_per_student-1 data files.
+
+    Args:
+        path (Path): path of the Moodle zip file
+        spec (SyntheticSpec): parameters of the download
+
+    Returns:
+        dict[str, str]: for each student directory the kind of the submission, i.e., 'regular', 'timeout', 'exception' or one of INVALID_KINDS
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(spec.seed)
+    n_timeouts = round(spec.students * spec.timeout_share)
+    n_exceptions = min(round(spec.students * spec.exception_share), spec.students - n_timeouts)
+    n_invalid = min(round(spec.students * spec.invalid_share), spec.students - n_timeouts - n_exceptions)
+    kinds = ['timeout'] * n_timeouts + ['exception'] * n_exceptions + [INVALID_KINDS[j % len(INVALID_KINDS)] for j in range(n_invalid)]
+    kinds += ['regular'] * (spec.students - len(kinds))
+    rng.shuffle(kinds)
+
+    submissions = {}
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as moodle_zip:
+        for i, kind in enumerate(kinds):
+            student_dir = f'Student{i} Synthetic_{100000+i}_assignsubmission_file_'
+            submissions[student_dir] = kind
+            if kind in INVALID_KINDS:
+                content = _invalid_content(spec, rng, kind)
+            else:
+                content = nbformat.writes(make_notebook(spec, rng, timeout=(kind == 'timeout'), exception=(kind == 'exception')))
+            if kind == 'no_notebook':
+                moodle_zip.writestr(f'{student_dir}/notes.txt', 'I did not manage to solve the exercises.')
+            elif spec.files_per_student <= 1:
+                buffer = io.BytesIO()
+                with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as student_zip:
+                    student_zip.writestr(NOTEBOOK_NAME, content)
+                moodle_zip.writestr(f'{student_dir}/{ASSIGNMENT_NAME}_{i}.zip', buffer.getvalue())
+            else:
+                moodle_zip.writestr(f'{student_dir}/{NOTEBOOK_NAME}', content)
+                for j in range(1, spec.files_per_student):
+                    rows = '\n'.join(f'{k},{rng.random()}' for k in range(100))
+                    moodle_zip.writestr(f'{student_dir}/data_{j}.csv', f'index,value\n{rows}\n')
+    return submissions
@@ -1,11 +1,26 @@
 __author__ = 'Benedikt Zoennchen'
 
-from ograder.config import Config
-from ograder.assign import Assignment
-from ograder.grade import Grader
-from ograder.project import Project
-from ograder.config import load as load
+from .version import __version__
 
-from ograder.cli import load_config as load_config
+# the public classes are imported on first access such that the command line interface
+# (ograder.cli) does not pay for otter, pandas, matplotlib, ... before a command needs them
+_LAZY = {
+    'Config': ('ograder.config', 'Config'),
+    'Assignment': ('ograder.assign', 'Assignment'),
+    'Grader': ('ograder.grade', 'Grader'),
+    'Project': ('ograder.project', 'Project'),
+    'load': ('ograder.config', 'load'),
+    'load_config': ('ograder.cli', 'load_config'),
+}
 
-from .version import __version__
\ No newline at end of file
+def __getattr__(name):
+    if name in _LAZY:
+        import importlib
+        module, attribute = _LAZY[name]
+        value = getattr(importlib.import_module(module), attribute)
+        globals()[name] = value
+        return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    return sorted(list(globals().keys()) + list(_LAZY.keys()))
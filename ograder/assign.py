@@ -1,14 +1,23 @@
+import json
 import nbformat
+import otter
 import subprocess
 import shutil
+import tempfile
 import yaml
 
 from .utils import peek, is_empty
+from .cache import content_hash
+from .version import __version__
 
+from datetime import datetime
 from otter.utils import loggers
 from pathlib import Path
 from ograder.config import Config
-from ograder.local_grader import LocalGrader
+from ograder.local_grader import LocalGrader, GradingRun
+from ograder.worker_pool import DEFAULT_MAX_TASKS_PER_WORKER
+from ograder.kernel_pool import BACKEND_PROCESS
+from ograder.store import RESULTS_FILE
 import warnings
 
 MARK_SEAL = '# SEAL'
@@ -22,6 +31,8 @@ MARK_END_TESTS = '# END TESTS'
 
 EXERCISE_ABBR = 'Aufgabe'
 
+BUILD_MANIFEST = 'build_manifest.json'
+
 LOGGER = loggers.get_logger(__name__)
 
 class Question():
@@ -34,20 +45,12 @@ class Assignment():
     def __init__(self, config: Config, name: str, assignment=False):
         self.name = name
         
-        # this is a little inefficient
         self.instructions = config.otter_notebook_config.export_cell.instructions
         
-        if assignment:
-            documents = config.assignments
-        else:
-            documents = config.exercises
-            
-        for exercise in documents:
-            if exercise['exercise'] == name:
-                #self.number_of_questions = exercise['number_of_questions'] if exercise['number_of_questions'] > 0 else 0
-                if exercise['instructions'] != None:
-                    self.instructions = exercise['instructions']
-                
+        exercise = config.entry(name, assignment)
+        if exercise != None and exercise.get('instructions') != None:
+            self.instructions = exercise['instructions']
+        
 
         self.assignment = assignment
         self.config : Config = config
@@ -56,7 +59,6 @@ class Assignment():
         self.solution_dir : Path = config.assign.solutions_dir / Path(name)
         self.autograder_dir : Path = config.assign.autograder_dir / Path(name)
         self.submission_dir: Path = config.assign.submission_dir / Path(name)
-        self.tmp_dir : Path = config.assign.tmp_dir / Path(name)
         #self.notebook = self.__read_main_notebook(self.main_dir)
         
     def upgrade_notebook(self, n=0) -> None:
@@ -80,12 +82,7 @@ class Assignment():
         if peek(self.main_dir.glob('requirements.txt'))[0] != None:
             otter_config_dict['requirements'] = 'requirements.txt'
             
-        files = []
-        for file in self.main_dir.rglob('[!.]*'):
-            rel_file = file.relative_to(self.main_dir)
-            if not str(rel_file).startswith('.') and not file.is_dir() and not str(rel_file).endswith('.ipynb'):
-                files.append(str(rel_file))
-        otter_config_dict['files'] = files
+        otter_config_dict['files'] = self.input_files()
         
         otter_config_dict['name'] = self.name
         if self.instructions != None:
@@ -118,6 +115,63 @@ class Assignment():
         else:
             LOGGER.info(f'No update required for {self}.')
         
+    def input_files(self) -> list[str]:
+        """
+        Returns:
+            list[str]: the files of the main directory (relative to it) which are no notebooks and not hidden, i.e., the files otter assign copies
+        """
+        files = []
+        for file in self.main_dir.rglob('[!.]*'):
+            rel_file = file.relative_to(self.main_dir)
+            if not str(rel_file).startswith('.') and not file.is_dir() and not str(rel_file).endswith('.ipynb'):
+                files.append(str(rel_file))
+        return files
+    
+    def build_inputs(self, seal_student_nb=True) -> dict:
+        """
+        Everything the generated notebooks and the autograder zip file depend on: the content hashes of the main notebook and the other files
+        of the main directory, the otter notebook config, the instructions and the versions of otter and ograder.
+
+        Returns:
+            dict: the inputs (JSON serializable)
+        """
+        otter_config_dict = self.config.otter_notebook_config.get_user_config()
+        notebook = self.__find_notebook(self.main_dir)
+        inputs = {
+            'notebook': {notebook.name: content_hash(notebook)} if notebook != None else {},
+            'files': {file: content_hash(self.main_dir / Path(file)) for file in sorted(self.input_files())},
+            'otter_notebook_config': otter_config_dict,
+            'instructions': self.instructions,
+            'seal_student_nb': seal_student_nb,
+            'otter': otter.__version__,
+            'ograder': __version__,
+        }
+        # the round trip normalizes the values, e.g., tuples and paths
+        return json.loads(json.dumps(inputs, sort_keys=True, default=str))
+    
+    def manifest_path(self) -> Path:
+        return self.autograder_dir / Path(BUILD_MANIFEST)
+    
+    def is_up_to_date(self, inputs: dict) -> bool:
+        """
+        Returns:
+            bool: True if and only if the student notebook, the solution and the autograder zip file exist and were generated from inputs (see build_inputs)
+        """
+        path = self.manifest_path()
+        if not path.exists() or self.__find_notebook(self.student_dir) == None or not self.solution_dir.exists() or self.__find_zip(self.autograder_dir) == None:
+            return False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('inputs') == inputs
+        except (OSError, ValueError) as e:
+            LOGGER.warning(f'unable to read the build manifest {path}: {e}')
+            return False
+    
+    def __write_manifest(self, inputs: dict) -> None:
+        path = self.manifest_path()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'time': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'), 'inputs': inputs}, f, indent=2, sort_keys=True)
+    
     def __normalize(self, notebook):
         nchanges, notebook = nbformat.validator.normalize(notebook)
         return notebook
@@ -208,11 +262,29 @@ class Assignment():
             self.__write_to_main_nb(notebook, override, exist_ok)
         return notebook
     
-    def grade(self, timeout=None, plot=False):
+    def grade(self, timeout=None, plot=False, jobs=None, max_tasks_per_worker=DEFAULT_MAX_TASKS_PER_WORKER, use_cache=True, resume=None, parquet=False, profile=False, profile_workers=False, coordinator=None, authkey=None, dedup=True, memory_limit=None, cpu_limit=None, backend=BACKEND_PROCESS, prescreen=True, since=None, progress_file=None):
         self.submission_dir.mkdir(parents=True, exist_ok=True)
         grader = LocalGrader(self.autograder_dir, self.submission_dir)
         manual_questions = self.get_manual_questions()
-        grader.grade(manual_questions, moodle_assignment=True, timeount_in_seconds=timeout, plot=plot)
+        grader.grade(manual_questions, moodle_assignment=True, timeount_in_seconds=timeout, plot=plot, jobs=jobs, max_tasks_per_worker=max_tasks_per_worker, use_cache=use_cache, resume=resume, parquet=parquet, profile=profile, profile_workers=profile_workers, coordinator=coordinator, authkey=authkey, dedup=dedup, memory_limit_mb=memory_limit, cpu_limit=cpu_limit, backend=backend, prescreen=prescreen, template=self.student_notebook_path(), since=since, progress_file=progress_file, store=self.results_path(), semester=self.config.semester)
+    
+    def prepare_grading(self, timeout=None, use_cache=True, parquet=False, dedup=True, memory_limit=None, cpu_limit=None, backend=BACKEND_PROCESS, prescreen=True) -> GradingRun:
+        """
+        Prepares the grading of the submissions without grading them, see LocalGrader.grade_runs.
+
+        Returns:
+            GradingRun: the prepared grading or None if there is nothing that can be graded
+        """
+        self.submission_dir.mkdir(parents=True, exist_ok=True)
+        grader = LocalGrader(self.autograder_dir, self.submission_dir)
+        return grader.prepare(self.get_manual_questions(), timeount_in_seconds=timeout, use_cache=use_cache, parquet=parquet, dedup=dedup, memory_limit_mb=memory_limit, cpu_limit=cpu_limit, backend=backend, prescreen=prescreen, template=self.student_notebook_path(), store=self.results_path(), semester=self.config.semester)
+    
+    def results_path(self) -> Path:
+        """
+        Returns:
+            Path: the result database of the project (see store.ResultStore)
+        """
+        return self.config.root_dir / Path(RESULTS_FILE)
     
     def __write_to_student_nb(self, notebook, override=False, exist_ok=False) -> None:
         self.__write(self.student_dir, notebook, override, exist_ok)
@@ -241,31 +313,52 @@ class Assignment():
                     LOGGER.error(f'Could not write to {notebook_path}.')
                     raise e
     
-    def generate(self, run_tests:bool=True, seal_student_nb=True) -> None:        
+    def generate(self, run_tests:bool=True, seal_student_nb=True, raise_error=False, force=True) -> bool:
+        """
+        Generates the student notebook, the solution and the autograder zip file by otter assign.
+        otter assign writes into a fresh directory below config.assign.tmp_dir, i.e., assignments can be generated concurrently.
+        A successful generation records its inputs (see build_inputs) in the build manifest next to the autograder zip file.
+
+        Args:
+            run_tests (bool, optional): let otter assign run the tests of the solution
+            seal_student_nb (bool, optional): seal the student notebook
+            raise_error (bool, optional): raise the error of a failed generation after it is logged
+            force (bool, optional): generate even if the inputs did not change since the last generation
+
+        Returns:
+            bool: False if the generation was skipped since everything is up to date or it failed, otherwise True
+        """
+        tmp_dir = None
         try:
+            inputs = self.build_inputs(seal_student_nb)
+            if not force and self.is_up_to_date(inputs):
+                LOGGER.info(f'{self} is up to date.')
+                return False
+            
             # remove all generated noteobook if they are there
             self.remove_notebooks()
             
-            if run_tests:
-                LOGGER.info(f'otter assign {str(self.__find_notebook(self.main_dir))} {str(self.tmp_dir)}')
-                subprocess.check_call(
-                    ['otter', 'assign', str(self.__find_notebook(self.main_dir)), str(self.tmp_dir)])
-            else:
-                LOGGER.info(f'otter assign --no-run-tests {str(self.__find_notebook(self.main_dir))} {str(self.tmp_dir)}')
-                subprocess.check_call(
-                    ['otter', 'assign', '--no-run-tests', str(self.__find_notebook(self.main_dir)), str(self.tmp_dir)])
+            self.config.assign.tmp_dir.mkdir(parents=True, exist_ok=True)
+            tmp_dir = Path(tempfile.mkdtemp(prefix=f'{self.name}_', dir=self.config.assign.tmp_dir))
+            command = ['otter', 'assign'] + ([] if run_tests else ['--no-run-tests']) + [str(self.__find_notebook(self.main_dir)), str(tmp_dir)]
+            LOGGER.info(' '.join(command))
+            # the output is captured such that concurrent generations do not interleave
+            process = subprocess.run(command, capture_output=True, text=True)
+            LOGGER.debug(process.stdout)
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, command, output=process.stdout, stderr=process.stderr)
                 
             # extract the student notebook
             self.student_dir.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copytree(self.tmp_dir / Path('student'), self.student_dir)
-            LOGGER.info(f'moved {self.tmp_dir / Path("student")} -> {self.student_dir}')
+            shutil.copytree(tmp_dir / Path('student'), self.student_dir)
+            LOGGER.info(f'moved {tmp_dir / Path("student")} -> {self.student_dir}')
             
             # extract the zip file to grade
             self.remove_autograding_notebook()
             self.autograder_dir.mkdir(parents=True, exist_ok=True)
-            zip_file = self.__find_zip(self.tmp_dir / Path('autograder'))
+            zip_file = self.__find_zip(tmp_dir / Path('autograder'))
             if zip_file == None:
-                LOGGER.error(f'There is no zip file in {self.tmp_dir / Path("autograder")}')
+                raise FileNotFoundError(f'There is no zip file in {tmp_dir / Path("autograder")}')
             
             zip_file.rename(self.autograder_dir / zip_file.name)
             LOGGER.info(
@@ -273,12 +366,9 @@ class Assignment():
                         
             # extract the solution notebook
             self.solution_dir.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copytree(self.tmp_dir / Path('autograder'), self.solution_dir)
+            shutil.copytree(tmp_dir / Path('autograder'), self.solution_dir)
             LOGGER.info(
-                f'moved {self.tmp_dir / Path("autograder")} -> {self.solution_dir}')
-            
-            shutil.rmtree(str(self.tmp_dir))
-            LOGGER.info( f'removed {self.tmp_dir}')
+                f'moved {tmp_dir / Path("autograder")} -> {self.solution_dir}')
             
             if seal_student_nb:
                 notebook = self.__seal_notebook(self.__read_student_notebook())
@@ -286,10 +376,22 @@ class Assignment():
             
             LOGGER.info(f'sealed student notebook')
             
+            self.__write_manifest(inputs)
+            return True
         except subprocess.CalledProcessError as error:
-            LOGGER.error(f'otter assign failed for assignment {self}: {error.output}')
-        #except Exception as error:
-        #    LOGGER.error(f'otter assign failed for assignment {self}: {error}')
+            LOGGER.error(f'otter assign failed for assignment {self}: {(error.stderr or error.output or "").strip()}')
+            if raise_error:
+                raise
+            return False
+        except Exception as error:
+            LOGGER.error(f'generation failed for assignment {self}: {error}')
+            if raise_error:
+                raise
+            return False
+        finally:
+            if tmp_dir != None and tmp_dir.exists():
+                shutil.rmtree(str(tmp_dir))
+                LOGGER.info( f'removed {tmp_dir}')
              
     def __seal_notebook(self, notebook: nbformat.NotebookNode):
         """
@@ -409,6 +511,13 @@ class Assignment():
                     LOGGER.error(f'Could not read from {file}')
                     return None
      
+    def student_notebook_path(self) -> Path:
+        """
+        Returns:
+            Path: path to the generated student notebook or None if it has not been generated (ograder assign)
+        """
+        return self.__find_notebook(self.student_dir)
+    
     def __read_student_notebook(self) -> nbformat.NotebookNode:
         path_to_notebook, _ = peek(self.student_dir.glob('*.ipynb'))
         return self.__read_notebook(path_to_notebook)
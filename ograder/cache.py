@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import zipfile
+
+from pathlib import Path
+from typing import Optional
+
+from otter.utils import loggers
+
+LOGGER = loggers.get_logger(__name__)
+
+DEFAULT_CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'ograder' / 'results'
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024 # bytes
+
+def content_hash(path: Path) -> str:
+    """
+    Computes a hash of the content of a zip file which does not depend on the zip meta data, e.g., timestamps.
+    Zip files inside of the zip file are hashed by their content as well.
+    Other files are hashed byte by byte.
+
+    Args:
+        path (Path): path to the file
+
+    Returns:
+        str: hex digest of the content
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            return _zip_hash(zf)
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _zip_hash(zf: zipfile.ZipFile) -> str:
+    sha = hashlib.sha256()
+    for info in sorted(zf.infolist(), key=lambda info: info.filename):
+        if info.is_dir():
+            continue
+        sha.update(info.filename.encode('utf-8'))
+        with zf.open(info) as member:
+            if info.filename.endswith('.zip'):
+                with zipfile.ZipFile(member) as inner:
+                    sha.update(_zip_hash(inner).encode('utf-8'))
+            else:
+                for chunk in iter(lambda: member.read(1024 * 1024), b''):
+                    sha.update(chunk)
+    return sha.hexdigest()
+
+class ResultCache:
+
+    def __init__(self, directory: Path=DEFAULT_CACHE_DIR, max_size: int=DEFAULT_CACHE_SIZE):
+        """
+        On-disk cache which maps (submission hash, autograder hash, otter version) to the grading result, i.e.,
+        a list of (question name, score, possible) triples. If the cache gets larger than max_size bytes
+        the least recently used entries are evicted.
+
+        Args:
+            directory (Path, optional): directory of the cache entries
+            max_size (int, optional): maximum size of the cache in bytes
+        """
+        self.directory: Path = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.size = sum(entry.stat().st_size for entry in self.directory.glob('*.json'))
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(submission_hash: str, autograder_hash: str, otter_version: str) -> str:
+        return hashlib.sha256(f'{submission_hash}:{autograder_hash}:{otter_version}'.encode('utf-8')).hexdigest()
+
+    def __path(self, key: str) -> Path:
+        return self.directory / Path(f'{key}.json')
+
+    def get(self, key: str) -> Optional[list[tuple[str, float, float]]]:
+        path = self.__path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            os.utime(path) # remember the usage for the eviction
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [tuple(question) for question in entry['questions']]
+
+    def put(self, key: str, questions: list[tuple[str, float, float]]) -> None:
+        path = self.__path(key)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'questions': [list(question) for question in questions]}, f)
+        old_size = path.stat().st_size if path.exists() else 0
+        os.replace(tmp_path, path)
+        self.size += path.stat().st_size - old_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache is at most max_size bytes large.
+        """
+        entries = sorted(self.directory.glob('*.json'), key=lambda entry: entry.stat().st_mtime)
+        self.size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.size <= self.max_size:
+                break
+            self.size -= entry.stat().st_size
+            entry.unlink()
+            LOGGER.debug(f'evicted {entry} from the result cache')
+
+    def clear(self) -> None:
+        for entry in self.directory.glob('*.json'):
+            entry.unlink()
+        self.size = 0
@@ -1,25 +1,44 @@
 import click
-from .version import print_version_info
-from .grade import Grader
-from .local_grader import LocalGrader
-from .project import Project
-from .assign import Assignment
-import ograder.config as conf
+import functools
+import logging
 import os
-from otter.cli import _verbosity
-from .gpt import ChatGPT
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from .version import print_version_info
+# only light modules are imported here, the heavy ones (otter, pandas, matplotlib, openai, ...) are imported by the commands which need them
+from .defaults import DEFAULT_MAX_TASKS_PER_WORKER, BACKEND_PROCESS, BACKENDS, DEFAULT_PORT, AUTHKEY_ENV, RESULTS_FILE, GROUP_BY
 
 CONFIG_PATH = os.path.expanduser("~") + '/ograder.yml'
 
-def load_config() -> conf.Config:
+_VERBOSITY_LEVELS = {
+    1: logging.INFO,
+    2: logging.DEBUG,
+}
+
+def _verbosity(f):
+    # like otter.cli._verbosity, but otter is only imported if the log level changes
+    @click.option("-v", "--verbose", "verbosity", count=True, help="Verbosity of the logged output")
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        verbosity = kwargs.pop("verbosity")
+        if verbosity > 0:
+            from otter.utils import loggers
+            loggers.set_level(_VERBOSITY_LEVELS[min(verbosity, max(_VERBOSITY_LEVELS.keys()))])
+        return f(*args, **kwargs)
+    return wrapper
+
+def load_config() -> 'Config':
     """
     Loads and returns the ograder configuration which defines
     the structure of your ograder projects.
 
     \b
     Returns:
-        conf.Config: the ograder user specific configuration
+        Config: the ograder user specific configuration
     """
+    import ograder.config as conf
     return conf.load(CONFIG_PATH)
 
 @click.group(invoke_without_command=True)
@@ -41,38 +60,63 @@ def cli(version, config):
 @_verbosity
 @click.option('-s', '--skip_seal', default= False, is_flag=True, show_default=True, type=bool, help='prevent sealing')
 @click.option('-t', '--run_tests', default= False, is_flag=True, show_default=True, type=bool, help='run otter tests.')
+@click.option('-j', '--jobs', default=1, show_default=True, type=int, help='number of assignments generated in parallel.')
+@click.option('-f', '--force', default=False, is_flag=True, show_default=True, type=bool, help='generate also the assignments whose inputs did not change since their last generation.')
+@click.option('--profile', default=False, is_flag=True, show_default=True, type=bool, help='profile the generation and write the profile to <semester>/profiles.')
 @click.argument('names', nargs=-1)
-def assign(skip_seal:bool, run_tests: bool, names: list[str]):
+def assign(skip_seal:bool, run_tests: bool, jobs: int, force: bool, profile: bool, names: list[str]):
     """
     Generates for each assignment, identified by names, all three required parts:
     (1) student: a notebook that contains the exercise without the solution
     (2) solution: a notebook that contains the solution
     (3) autograder: a zip file to grade the students solution
+    Assignments whose main notebook, files and otter config did not change since their last generation are skipped unless --force is given.
     """
-    return __assign(skip_seal, run_tests, names)
+    if profile:
+        from .profiling import Profiler
+        config = load_config()
+        time_str = datetime.now().strftime('%Y%m%d_%H%M%S')
+        with Profiler(Path(config.root_dir) / Path(config.semester) / 'profiles' / f'assign_{time_str}'):
+            assignments, failures = __assign(skip_seal, run_tests, names, jobs, force)
+    else:
+        assignments, failures = __assign(skip_seal, run_tests, names, jobs, force)
+    
+    if len(failures) > 0:
+        click.echo(f'the generation of {len(failures)} of {len(assignments)} assignments failed:', err=True)
+        for assignment, error in failures:
+            click.echo(f'  {assignment}: {_describe(error)}', err=True)
+        sys.exit(1)
+
+def _describe(error: Exception) -> str:
+    if isinstance(error, subprocess.CalledProcessError):
+        lines = (error.stderr or error.output or '').strip().splitlines()
+        return f'otter assign exited with {error.returncode}' + (f': {lines[-1]}' if len(lines) > 0 else '')
+    return f'{type(error).__name__}: {error}'
 
-def __assign(skip_seal:bool, run_tests: bool, names: list[str]):
+def __assign(skip_seal:bool, run_tests: bool, names: list[str], jobs: int=1, force=False):
     """
     Generates for each assignment, identified by names, all three required parts: 
     (1) student: a notebook that contains the exercise without the solution
     (2) solution: a notebook that contains the solution
     (3) autograder: a zip file to grade the students solution
+
+    Returns:
+        tuple[list[Assignment], list[tuple[Assignment, Exception]]]: the assignments and the failed generations
     """
-    config = load_config()
+    from .project import Project
+    project = Project(load_config())
     assignments = []
     if len(names) > 0:
         for name in names:
-            assignment = Assignment(config, name)
+            assignment = project.get(name)
             if assignment.main_notebook_exists():
-                assignment.generate(run_tests=run_tests, seal_student_nb=(not skip_seal))
                 assignments.append(assignment)
             else:
                 click.echo(f'main notebook for {assignment} does not exists.', err=True)
     else:
-        project = Project(config)
-        project.generate_all(run_tests=run_tests, seal_students_nb=(not skip_seal))
-        assignments =  project.all_assignments()
-    return assignments
+        assignments = project.all_assignments()
+    failures = project.generate(assignments, run_tests=run_tests, seal_students_nb=(not skip_seal), jobs=jobs, force=force)
+    return assignments, failures
     
 @click.command()
 @_verbosity
@@ -81,49 +125,93 @@ def extract_questions(names: list[str]):
     __extract_questions(names)
 
 def __extract_questions(names: list[str]):
-    config = load_config()
+    from .project import Project
+    project = Project(load_config())
     if len(names) > 0:
         for name in names:
-            assignment = Assignment(config, name)
+            assignment = project.get(name)
             if assignment.main_notebook_exists():
                 assignment.read_questions()
             else:
                 click.echo(f'main notebook for {assignment} does not exists.', err=True)
     else:
-        project = Project(config)
         project.read_questions()
 
 @click.command()
 @_verbosity
 @click.option('-t', '--timeout', default=None, show_default=True, type=float, help='time after the grading of a notebook will be terminated')
 @click.option('-p', '--plot', default= False, is_flag=True, show_default=True, type=bool, help='plot the grading overview.')
+@click.option('-j', '--jobs', default=None, type=int, help='number of submissions graded in parallel  [default: number of usable cores]')
+@click.option('-k', '--max_tasks_per_worker', default=DEFAULT_MAX_TASKS_PER_WORKER, show_default=True, type=int, help='number of submissions after which a grading worker is replaced by a fresh one')
+@click.option('--no_cache', default=False, is_flag=True, show_default=True, type=bool, help='grade every submission again instead of reusing cached results.')
+@click.option('-r', '--resume', default=None, type=click.Path(exists=True, file_okay=False), help='grading_<timestamp> directory of an interrupted run which will be continued.')
+@click.option('--parquet', default=False, is_flag=True, show_default=True, type=bool, help='additionally write the grading result in the Parquet format.')
+@click.option('--profile', default=False, is_flag=True, show_default=True, type=bool, help='profile the grading and write grading_<timestamp>.pstats and .collapsed next to the grading directory.')
+@click.option('--profile_workers', default=False, is_flag=True, show_default=True, type=bool, help='additionally profile each grading worker and merge the profiles into grading_<timestamp>_worker_profiles.pstats.')
+@click.option('-c', '--coordinator', default=None, type=str, help=f'grade by remote workers (ograder worker) which connect to this [host]:port  [default port: {DEFAULT_PORT}]')
+@click.option('--authkey', default=None, type=str, envvar=AUTHKEY_ENV, help=f'shared secret of the coordinator and its workers  [default: ${AUTHKEY_ENV} or a random key]')
+@click.option('--no_dedup', default=False, is_flag=True, show_default=True, type=bool, help='grade identical submissions separately instead of copying the result.')
+@click.option('-m', '--memory_limit', default=None, type=float, help='memory (RSS) in MB after which the kernel grading a notebook will be terminated (requires psutil)')
+@click.option('--cpu_limit', default=None, type=float, help='CPU time in seconds after which the kernel grading a notebook will be terminated (requires psutil)')
+@click.option('-b', '--backend', default=BACKEND_PROCESS, show_default=True, type=click.Choice(BACKENDS), help='process: otter starts a kernel for each notebook, kernel: each worker leases pre-started kernels which preloaded the common imports.')
+@click.option('--no_prescreen', default=False, is_flag=True, show_default=True, type=bool, help='execute every submission instead of sorting out invalid notebooks (syntax errors, unchanged template, ...) beforehand.')
+@click.option('-s', '--since', default=None, type=click.Path(exists=True, file_okay=False), help='grading_<timestamp> directory of an earlier run, only new or changed submissions are graded and the other results are carried over.')
+@click.option('--progress_file', default=None, type=click.Path(dir_okay=False), help='file to which the progress is written every few seconds, JSON lines or, if it ends with .prom, the Prometheus text format.')
 @click.argument('names', nargs=-1)
-def grade(timeout: float, plot: bool, names: list[str]):
+def grade(timeout: float, plot: bool, jobs: int, max_tasks_per_worker: int, no_cache: bool, resume: str, parquet: bool, profile: bool, profile_workers: bool, coordinator: str, authkey: str, no_dedup: bool, memory_limit: float, cpu_limit: float, backend: str, no_prescreen: bool, since: str, progress_file: str, names: list[str]):
     """
     Grades all (Moodle) submissions.
 
     \b
     Args:
         timeout (float): time after the execution of a notebook gets terminated
+        jobs (int): number of submissions graded in parallel
+        max_tasks_per_worker (int): number of submissions after which a grading worker is recycled
+        no_cache (bool): ignore cached results of earlier runs
+        resume (str): grading directory of an interrupted run of the (single) assignment given by names
+        parquet (bool): additionally write the grading result as Parquet file
+        profile (bool): profile the grading process
+        profile_workers (bool): profile the grading workers
+        coordinator (str): address on which remote workers are awaited
+        authkey (str): shared secret of the coordinator and its workers
+        no_dedup (bool): grade identical submissions separately
+        memory_limit (float): memory limit of a kernel in MB
+        cpu_limit (float): CPU time limit of a kernel in seconds
+        backend (str): how the notebooks are executed (process or kernel)
+        no_prescreen (bool): do not sort out invalid submissions before their execution
+        since (str): grading directory of an earlier run of the (single) assignment given by names
+        progress_file (str): file to which the progress is written
         names (list[str]): assignment names that shoud be graded
     """
-    __grade(timeout, plot, names)
+    if resume != None and len(names) != 1:
+        click.echo('--resume requires exactly one assignment name.', err=True)
+        return
+    if since != None and len(names) != 1:
+        click.echo('--since requires exactly one assignment name.', err=True)
+        return
+    if coordinator != None:
+        from .distributed import parse_address, new_authkey
+        coordinator = parse_address(coordinator)
+        if authkey == None:
+            authkey = new_authkey()
+            click.echo(f'start the workers by: {AUTHKEY_ENV}={authkey} ograder worker <host>:{coordinator[1]}')
+    __grade(timeout, plot, jobs, max_tasks_per_worker, not no_cache, parquet, names, resume, profile, profile_workers, coordinator, authkey, not no_dedup, memory_limit, cpu_limit, backend, not no_prescreen, since, progress_file)
 
 
-def __grade(timeout: float, plot: bool, names: list[str]):
-    config = load_config()
+def __grade(timeout: float, plot: bool, jobs: int, max_tasks_per_worker: int, use_cache: bool, parquet: bool, names: list[str], resume: str=None, profile: bool=False, profile_workers: bool=False, coordinator: tuple[str, int]=None, authkey: str=None, dedup: bool=True, memory_limit: float=None, cpu_limit: float=None, backend: str=BACKEND_PROCESS, prescreen: bool=True, since: str=None, progress_file: str=None):
+    from .project import Project
+    project = Project(load_config())
     assignments = []
     if len(names) > 0:
         for name in names:
-            assignment = Assignment(config, name)
+            assignment = project.get(name)
             if assignment.main_notebook_exists():
-                assignment.grade(timeout=timeout, plot=plot)
+                assignment.grade(timeout=timeout, plot=plot, jobs=jobs, max_tasks_per_worker=max_tasks_per_worker, use_cache=use_cache, resume=resume, parquet=parquet, profile=profile, profile_workers=profile_workers, coordinator=coordinator, authkey=authkey, dedup=dedup, memory_limit=memory_limit, cpu_limit=cpu_limit, backend=backend, prescreen=prescreen, since=since, progress_file=progress_file)
             else:
                 click.echo(
                     f'main notebook for {assignment} does not exists.', err=True)
     else:
-        project = Project(config)
-        project.grade_all(timeout=timeout, plot=plot)
+        project.grade_all(timeout=timeout, plot=plot, jobs=jobs, max_tasks_per_worker=max_tasks_per_worker, use_cache=use_cache, parquet=parquet, profile=profile, profile_workers=profile_workers, coordinator=coordinator, authkey=authkey, dedup=dedup, memory_limit=memory_limit, cpu_limit=cpu_limit, backend=backend, prescreen=prescreen, progress_file=progress_file)
         assignments = project.all_assignments()
     return assignments
 
@@ -166,16 +254,16 @@ def add_empty_questions(n: int, assigments: list[str]):
         n (int): number of questions
         names (list[str]): list of assignments
     """
-    config = load_config()
+    from .project import Project
+    project = Project(load_config())
     if len(assigments) > 0:
         for name in assigments:
-            assignment = Assignment(config, name)
+            assignment = project.get(name)
             if assignment.main_notebook_exists():
                 assignment.add_empty_questions(n)
             else:
                 click.echo(f'main notebook for {assignment} does not exists.', err=True)
     else:
-        project = Project(config)
         project.add_empty_questions(n)
 
 @click.command()
@@ -195,9 +283,10 @@ def add_questions(n: int, assignment: str, topic: str, difficulty: str):
         topic (str): topic for which exercises should be generated
         difficulty (str): difficulty level, e.g. 'easy', 'hard'
     """
+    from .project import Project
+    from .gpt import ChatGPT
 
-    config = load_config()
-    assignment = Assignment(config, assignment)
+    assignment = Project(load_config()).get(assignment)
     
     with open('api.key', 'r') as api_key:
         API_KEY = api_key.read()
@@ -221,9 +310,9 @@ def init(n=0):
     """
     Initializes the complete ograder project, i.e., directory structure using the ograder.yml file in your home directory.
     """
+    from .project import Project
 
-    config = load_config()
-    project = Project(config)
+    project = Project(load_config())
     if not project.exists():
         project.init(n, exist_ok=False)
     else:
@@ -237,15 +326,86 @@ def upgrade(n=0):
     """
     Upgrades all notebooks accoding to your ograder.yml file in your home directory.
     """
+    from .project import Project
 
-    config = load_config()
-    project = Project(config)
+    project = Project(load_config())
     project.upgrade_notebooks(n)         
 
 cli.add_command(init)
+@click.command()
+@_verbosity
+@click.option('-j', '--jobs', default=1, show_default=True, type=int, help='number of submissions graded in parallel.')
+@click.option('-k', '--max_tasks_per_worker', default=DEFAULT_MAX_TASKS_PER_WORKER, show_default=True, type=int, help='number of submissions after which a grading worker is replaced by a fresh one')
+@click.option('--authkey', required=True, type=str, envvar=AUTHKEY_ENV, help=f'shared secret of the coordinator and its workers  [default: ${AUTHKEY_ENV}]')
+@click.option('--once', default=False, is_flag=True, show_default=True, type=bool, help='exit after the coordinator finished its grading.')
+@click.argument('coordinator')
+def worker(jobs: int, max_tasks_per_worker: int, authkey: str, once: bool, coordinator: str):
+    """
+    Grades submissions handed out by a coordinator, i.e., ograder grade --coordinator, where COORDINATOR is its host[:port].
+    The worker has to run in an environment which is able to execute the notebooks (same packages as the coordinator).
+    """
+    from .distributed import parse_address, serve
+    serve(parse_address(coordinator), authkey, jobs, max_tasks_per_worker, once)
+
+@click.group()
+def results():
+    """
+    Queries the result database of the project, i.e., the results of all grading runs of all assignments and semesters.
+    """
+    pass
+
+@click.command()
+@_verbosity
+@click.option('-s', '--semester', default=None, type=str, help='only this semester  [default: the semester of the config]')
+@click.option('-a', '--assignment', 'assignments', multiple=True, type=str, help='only this assignment (can be given multiple times)')
+@click.option('--student', default=None, type=str, help='only students whose name or forname contains this text')
+@click.option('-q', '--question', default=None, type=str, help='only this question')
+@click.option('-g', '--group_by', default=None, type=click.Choice(GROUP_BY), help='student: overall score of each student and assignment, assignment: mean overall score, question: mean score of each question (lowest first)')
+@click.option('--all_semesters', default=False, is_flag=True, show_default=True, type=bool, help='query all semesters.')
+@click.option('--all_runs', default=False, is_flag=True, show_default=True, type=bool, help='consider every grading run instead of the latest run of each assignment.')
+@click.option('--sql', default=None, type=str, help='execute this SQL query instead (tables: runs, students, questions, scores, views: latest_runs, latest_scores)')
+@click.option('-o', '--output', default=None, type=click.Path(dir_okay=False), help='write the result to this csv file instead of printing it')
+def query(semester: str, assignments: list[str], student: str, question: str, group_by: str, all_semesters: bool, all_runs: bool, sql: str, output: str):
+    """
+    Queries the stored grading results.
+
+    \b
+    Args:
+        semester (str): semester of the results
+        assignments (list[str]): names of the assignments
+        student (str): part of the name of the students
+        question (str): name of the question
+        group_by (str): aggregation of the scores
+        all_semesters (bool): ignore the semester
+        all_runs (bool): consider all grading runs
+        sql (str): custom SQL query
+        output (str): path to the csv file
+    """
+    from .store import ResultStore
+    from .results import CSV_SEPARATOR
+    config = load_config()
+    path = config.root_dir / Path(RESULTS_FILE)
+    if not path.exists():
+        click.echo(f'there is no result database {path}, grade an assignment first.', err=True)
+        return
+    with ResultStore(path) as store:
+        if sql != None:
+            data = store.sql(sql)
+        else:
+            semester = None if all_semesters else (semester or config.semester)
+            data = store.query(semester, list(assignments), student, question, group_by, all_runs)
+    if output != None:
+        data.to_csv(output, sep=CSV_SEPARATOR, index=False)
+    else:
+        click.echo(data.to_string(index=False))
+
+results.add_command(query)
+
 cli.add_command(upgrade)
 cli.add_command(assign)
 cli.add_command(grade)
+cli.add_command(worker)
+cli.add_command(results)
 cli.add_command(add_questions)
 cli.add_command(add_empty_questions)
 #cli.add_command(extract_questions)
@@ -1,3 +1,7 @@
+import hashlib
+import os
+import pickle
+
 from pathlib import Path
 
 import fica
@@ -5,8 +9,12 @@ import yaml
 
 from otter.utils import loggers
 
+from .version import __version__
+
 LOGGER = loggers.get_logger(__name__)
 
+CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'ograder' / 'config'
+
 class Config(fica.Config):
     """
     The Config class is a representation of all required configurations, such as:
@@ -29,6 +37,25 @@ class Config(fica.Config):
             user_config['assign']['submission_dir'] = semester_dir / Path(user_config['assign']['submission_dir'])
             user_config['assign']['tmp_dir'] = semester_dir / Path(user_config['assign']['tmp_dir'])
         super().__init__(user_config, documentation_mode=documentation_mode)
+        self._entries = None
+    
+    def entry(self, name: str, assignment=False) -> dict:
+        """
+        Looks up the entry of an exercise or assignment by an index which is built on first use.
+
+        Args:
+            name (str): name of the exercise or assignment
+            assignment (bool, optional): if True, name is looked up in the assignments, otherwise in the exercises
+
+        Returns:
+            dict: the entry or None if there is no such exercise or assignment
+        """
+        if self._entries == None:
+            self._entries = {
+                False: {exercise['exercise']: exercise for exercise in self.exercises},
+                True: {exercise['exercise']: exercise for exercise in self.assignments}
+            }
+        return self._entries[bool(assignment)].get(name)
         
     class AssignmentConfig(fica.Config):
         """
@@ -93,11 +120,58 @@ class Config(fica.Config):
     exercises = fica.Key(subkey_container=ExecisesConfig)
     assignments = fica.Key(subkey_container=ExecisesConfig)
               
-def load(config_file: str) -> Config: 
+_CONFIGS: dict[str, tuple[tuple, Config]] = {}
+
+def _cache_key(config_file: Path) -> tuple:
+    # the cached config is invalid if the file or the definition of Config changed
+    stat = config_file.stat()
+    return (stat.st_mtime_ns, stat.st_size, Path(__file__).stat().st_mtime_ns, __version__)
+
+def _cache_path(config_file: Path) -> Path:
+    return CACHE_DIR / Path(f'{hashlib.sha256(str(config_file).encode("utf-8")).hexdigest()[:16]}.pickle')
+
+def _read_cached(config_file: Path, key: tuple) -> Config:
+    try:
+        with open(_cache_path(config_file), 'rb') as f:
+            cached_key, config = pickle.load(f)
+        return config if cached_key == key else None
+    except Exception:
+        return None
+
+def _write_cached(config_file: Path, key: tuple, config: Config) -> None:
+    path = _cache_path(config_file)
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((key, config), f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        LOGGER.debug(f'unable to cache the config {config_file}: {e}')
+
+def load(config_file: str) -> Config:
+    """
+    Loads the ograder config file. The parsed config is cached in this process and in CACHE_DIR,
+    such that the file is only parsed again if it changed (modification time or size).
+
+    Args:
+        config_file (str): path to the ograder config file
+
+    Returns:
+        Config: the parsed config
+    """
+    config_file = Path(config_file).resolve()
     try:
-        with open(config_file, 'r') as file:
-            config = yaml.safe_load(file)
-        return Config(config)
+        key = _cache_key(config_file)
+        if str(config_file) in _CONFIGS and _CONFIGS[str(config_file)][0] == key:
+            return _CONFIGS[str(config_file)][1]
+        config = _read_cached(config_file, key)
+        if config == None:
+            with open(config_file, 'r') as file:
+                config = Config(yaml.load(file, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader)))
+            _write_cached(config_file, key, config)
+        _CONFIGS[str(config_file)] = (key, config)
+        return config
     except Exception as e:
-        LOGGER.error("could read/load the ograder config file: {config_file}")
+        LOGGER.error(f"could read/load the ograder config file: {config_file}")
         raise e
\ No newline at end of file
@@ -0,0 +1,101 @@
+import csv
+import hashlib
+import json
+import zipfile
+
+from pathlib import Path
+
+from otter.utils import loggers
+
+LOGGER = loggers.get_logger(__name__)
+
+CSV_SEPARATOR = ';'
+IGNORED_FILES = {'PersDaten.txt'}
+
+def _normalized_notebook(content: bytes) -> bytes:
+    """
+    Reduces a notebook to the type and source of its cells, i.e., metadata, outputs and execution counts are dropped.
+    """
+    try:
+        notebook = json.loads(content)
+    except ValueError:
+        return content
+    cells = []
+    for cell in notebook.get('cells', []):
+        source = cell.get('source', '')
+        cells.append([cell.get('cell_type'), ''.join(source) if isinstance(source, list) else source])
+    return json.dumps(cells, ensure_ascii=False).encode('utf-8')
+
+def _update(sha, zf: zipfile.ZipFile) -> None:
+    for info in sorted(zf.infolist(), key=lambda info: info.filename):
+        name = Path(info.filename).name
+        if info.is_dir() or name in IGNORED_FILES or info.filename.startswith('__MACOSX'):
+            continue
+        with zf.open(info) as member:
+            if info.filename.endswith('.zip'):
+                # the name of the student zip contains the student name
+                with zipfile.ZipFile(member) as inner:
+                    _update(sha, inner)
+            elif info.filename.endswith('.ipynb'):
+                # the notebook name does not matter for the grading
+                sha.update(b'.ipynb\0')
+                sha.update(_normalized_notebook(member.read()))
+            else:
+                sha.update(info.filename.encode('utf-8') + b'\0')
+                sha.update(member.read())
+
+def submission_hash(path: Path) -> str:
+    """
+    Computes a hash of a (repackaged) submission zip file which is equal for submissions that are graded equally:
+    the notebooks are compared by the type and source of their cells, other files by their name and content,
+    PersDaten.txt and the names of the notebooks and zip files are ignored.
+
+    Args:
+        path (Path): path to the submission zip file
+
+    Returns:
+        str: hex digest of the normalized content
+    """
+    sha = hashlib.sha256()
+    with zipfile.ZipFile(path) as zf:
+        _update(sha, zf)
+    return sha.hexdigest()
+
+def duplicate_groups(hashes: list[str]) -> dict[str, list[int]]:
+    """
+    Groups equal hashes.
+
+    Args:
+        hashes (list[str]): hash of each submission, None if it could not be computed
+
+    Returns:
+        dict[str, list[int]]: maps each hash to the indices of its submissions in the order of hashes
+    """
+    groups = {}
+    for i, h in enumerate(hashes):
+        if h != None:
+            groups.setdefault(h, []).append(i)
+    return groups
+
+def write_report(path: Path, students: list, groups: dict[str, list[int]]) -> int:
+    """
+    Writes the groups of identical submissions (at least two students) to a csv file, one row for each student.
+
+    Args:
+        path (Path): path to the report csv file
+        students (list[Student]): all students
+        groups (dict[str, list[int]]): groups of student indices, see duplicate_groups
+
+    Returns:
+        int: number of duplicate groups
+    """
+    duplicates = sorted((members for members in groups.values() if len(members) > 1), key=lambda members: -len(members))
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter=CSV_SEPARATOR)
+        writer.writerow(['group', 'size', 'name', 'forname', 'file'])
+        for group, members in enumerate(duplicates):
+            for i in members:
+                writer.writerow([group, len(members), students[i].name, students[i].forname, str(students[i].file)])
+    for group, members in enumerate(duplicates):
+        LOGGER.info(f'duplicate group {group}: {", ".join(str(students[i].file) for i in members)}')
+    return len(duplicates)
@@ -0,0 +1,14 @@
+# Constants which are needed to build the command line interface. This module must not import anything heavy
+# (otter, pandas, numpy, ...) such that `ograder --help` starts fast, the modules using these constants re-export them.
+
+DEFAULT_MAX_TASKS_PER_WORKER = 25
+
+BACKEND_PROCESS = 'process'
+BACKEND_KERNEL = 'kernel'
+BACKENDS = [BACKEND_PROCESS, BACKEND_KERNEL]
+
+DEFAULT_PORT = 6700
+AUTHKEY_ENV = 'OGRADER_AUTHKEY'
+
+RESULTS_FILE = 'results.sqlite'
+GROUP_BY = ['student', 'assignment', 'question']
@@ -0,0 +1,312 @@
+import collections
+import hashlib
+import os
+import queue
+import secrets
+import socket
+import tempfile
+import threading
+import time
+
+from multiprocessing.connection import Listener, Client, AuthenticationError
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from otter.utils import loggers
+
+from .defaults import DEFAULT_PORT, AUTHKEY_ENV
+from .worker_pool import WorkerPool, WorkerCrash, TaskStats, PRELOAD_MODULES, DEFAULT_MAX_TASKS_PER_WORKER
+
+LOGGER = loggers.get_logger(__name__)
+
+HEARTBEAT_SECONDS = 5 # interval in which a busy worker reports that it is alive
+LOST_WORKER_SECONDS = 30 # a busy worker which did not report for this time is considered lost
+RETRY_SECONDS = 2 # interval in which a worker tries to (re)connect to the coordinator
+MAX_ATTEMPTS = 3 # number of times a task is handed out before it is given up
+
+def parse_address(address: str, default_port: int=DEFAULT_PORT) -> tuple[str, int]:
+    """
+    Parses 'host:port', 'host' or ':port' into a (host, port) pair.
+    """
+    host, _, port = address.rpartition(':') if ':' in address else (address, None, '')
+    return (host if host != '' else 'localhost'), (int(port) if port != '' else default_port)
+
+def new_authkey() -> str:
+    return secrets.token_hex(16)
+
+class _LostWorker(Exception):
+    pass
+
+class Coordinator:
+
+    def __init__(self, autograder_zip: Path, address: tuple[str, int], authkey: str, lost_worker_seconds: float=LOST_WORKER_SECONDS, max_attempts: int=MAX_ATTEMPTS):
+        """
+        Hands out grading tasks to remote workers (see serve) which connect via TCP and send back the results.
+        It can be used like a WorkerPool of LocalGrader.run_grade_submission: the submission file of each task is sent to the worker
+        and graded against the autograder zip which every worker receives once when it connects.
+        The tasks of a worker whose connection breaks or which does not report for lost_worker_seconds are re-queued.
+        A task which has been handed out max_attempts times without result is given up (WorkerCrash).
+        The workers authenticate by the shared authkey, only start workers on machines you trust.
+
+        Args:
+            autograder_zip (Path): path to the autograder zip file
+            address (tuple[str, int]): (host, port) the coordinator listens on
+            authkey (str): shared secret of the coordinator and its workers
+            lost_worker_seconds (float, optional): time after which a silent busy worker is considered lost
+            max_attempts (int, optional): number of times a task is handed out
+        """
+        self.autograder_zip = Path(autograder_zip)
+        self.address = address
+        self.authkey = authkey.encode('utf-8')
+        self.lost_worker_seconds = lost_worker_seconds
+        self.max_attempts = max_attempts
+        self.timeout = None
+        self.listener: Listener = None
+        self.condition = threading.Condition()
+        self.pending = collections.deque()
+        self.pending_slow = collections.deque()
+        self.slow = set()
+        self.slow_workers = 1
+        self.busy_slow = 0
+        self.attempts = collections.Counter()
+        self.remaining = 0
+        self.closed = False
+        self.results = queue.Queue()
+        self.workers = set()
+        self.running: dict[str, tuple[Any, float]] = {} # the task of each busy worker and when it has been handed out
+        self.tasks_done = 0
+        self.requeued = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __accept(self) -> None:
+        while not self.closed:
+            try:
+                conn = self.listener.accept()
+            except (AuthenticationError, EOFError, ConnectionError) as e:
+                if not self.closed:
+                    LOGGER.warning(f'rejected a worker: {e}')
+                continue
+            except OSError:
+                break
+            if self.closed:
+                conn.close()
+                break
+            threading.Thread(target=self.__serve, args=(conn,), daemon=True).start()
+
+    def __next_task(self) -> tuple[Any, tuple]:
+        with self.condition:
+            while len(self.pending) + len(self.pending_slow) == 0 and self.remaining > 0 and not self.closed:
+                self.condition.wait()
+            if len(self.pending) + len(self.pending_slow) == 0:
+                return None
+            if len(self.pending_slow) > 0 and (self.busy_slow < self.slow_workers or len(self.pending) == 0):
+                key, args = self.pending_slow.pop()
+                self.busy_slow += 1
+            else:
+                key, args = self.pending.pop()
+            self.attempts[key] += 1
+            return key, args
+
+    def __finish(self, key: Any, result: Any, stats: TaskStats) -> None:
+        with self.condition:
+            self.remaining -= 1
+            self.tasks_done += 1
+            self.busy_slow -= int(key in self.slow)
+            self.condition.notify_all()
+        self.results.put((key, result, stats))
+
+    def __requeue(self, key: Any, args: tuple, dispatched: float, worker: str) -> None:
+        if self.attempts[key] >= self.max_attempts:
+            LOGGER.error(f'giving up {key} after {self.attempts[key]} attempts')
+            self.__finish(key, WorkerCrash(f'{self.attempts[key]} workers were lost while working on {key}'), TaskStats(time.monotonic() - dispatched))
+            return
+        LOGGER.warning(f'lost worker {worker}, re-queue {key}')
+        with self.condition:
+            (self.pending_slow if key in self.slow else self.pending).append((key, args))
+            self.busy_slow -= int(key in self.slow)
+            self.requeued += 1
+            self.condition.notify_all()
+
+    def __serve(self, conn) -> None:
+        task, dispatched, name = None, None, None
+        try:
+            _, name = conn.recv()
+            LOGGER.info(f'worker {name} connected')
+            with self.condition:
+                self.workers.add(name)
+            conn.send(('autograder', self.autograder_zip.name, self.autograder_zip.read_bytes(), self.timeout))
+            while True:
+                if task != None and not conn.poll(self.lost_worker_seconds):
+                    raise _LostWorker()
+                message = conn.recv()
+                if message[0] == 'result':
+                    _, key, result, stats = message
+                    task = None
+                    self.running.pop(name, None)
+                    self.__finish(key, result, TaskStats(time.monotonic() - dispatched, stats.transfer_seconds, stats.timed_out))
+                elif message[0] == 'get':
+                    task = self.__next_task()
+                    if task == None:
+                        conn.send(('stop',))
+                        break
+                    key, (submission_path, _, *options) = task
+                    dispatched = time.monotonic()
+                    self.running[name] = (key, dispatched)
+                    conn.send(('task', key, Path(submission_path).name, Path(submission_path).read_bytes(), options))
+        except (_LostWorker, EOFError, OSError):
+            self.running.pop(name, None)
+            if task != None:
+                self.__requeue(task[0], task[1], dispatched, name)
+        finally:
+            conn.close()
+
+    def run(self, tasks: Iterable[tuple[Any, tuple]], timeout: float=None, slow: set=None, slow_workers: int=1) -> Iterator[tuple[Any, Any, TaskStats]]:
+        """
+        Executes all tasks by the connected workers and yields (key, result, stats) triples in the order in which the tasks finish.
+        Like WorkerPool.run the slow tasks form a separate lane which occupies at most slow_workers workers as long as there are other tasks left.
+
+        Args:
+            tasks (Iterable[tuple[Any, tuple]]): (key, (submission_path, ag_path, ...)) pairs, ag_path is replaced by the autograder of the coordinator, the other arguments are passed to the worker
+            timeout (float, optional): time after the grading of a task will be terminated (by the worker)
+            slow (set, optional): keys of the tasks which are likely to hit the timeout
+            slow_workers (int, optional): number of workers of the slow lane
+
+        Yields:
+            Iterator[tuple[Any, Any, TaskStats]]: (key, result, stats) triples
+        """
+        tasks = list(tasks)
+        with self.condition:
+            self.slow |= set() if slow == None else slow
+            self.slow_workers = slow_workers
+            self.pending.extend(task for task in reversed(tasks) if task[0] not in self.slow)
+            self.pending_slow.extend(task for task in reversed(tasks) if task[0] in self.slow)
+            self.remaining += len(tasks)
+        self.timeout = timeout
+        if self.listener == None:
+            self.listener = Listener(self.address, authkey=self.authkey)
+            threading.Thread(target=self.__accept, daemon=True).start()
+            LOGGER.info(f'waiting for workers on {self.address[0]}:{self.address[1]}, start them by: ograder worker {socket.gethostname()}:{self.address[1]}')
+        for _ in range(len(tasks)):
+            yield self.results.get()
+
+    def close(self) -> None:
+        """
+        Tells the workers that there is nothing left to do and stops listening.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.listener != None:
+            # wake up the accepting thread, its handshake with this connection fails and it stops
+            host, port = self.listener.address
+            try:
+                socket.create_connection(('localhost' if host in ('', '0.0.0.0') else host, port), timeout=1).close()
+            except OSError:
+                pass
+            self.listener.close()
+
+    def status(self) -> list[tuple[str, Any, float]]:
+        """
+        Returns:
+            list[tuple[str, Any, float]]: for each connected worker its name, the key of its task (None if it is idle) and the seconds it has been working on it
+        """
+        now = time.monotonic()
+        with self.condition:
+            names = sorted(self.workers)
+            running = dict(self.running)
+        return [(name, *((running[name][0], now - running[name][1]) if name in running else (None, 0.0))) for name in names]
+
+    def summary(self) -> str:
+        return f'{len(self.workers)} remote worker(s) executed {self.tasks_done} task(s), {self.requeued} task(s) were re-queued'
+
+def _heartbeat(conn, lock: threading.Lock, stop: threading.Event) -> None:
+    while not stop.wait(HEARTBEAT_SECONDS):
+        try:
+            with lock:
+                conn.send(('heartbeat',))
+        except OSError:
+            break
+
+def _serve_connection(conn, pool: WorkerPool, work_dir: Path, name: str) -> None:
+    lock = threading.Lock()
+    conn.send(('hello', name))
+    _, ag_name, ag_bytes, timeout = conn.recv()
+    ag_path = work_dir / f'{hashlib.sha256(ag_bytes).hexdigest()[:16]}_{ag_name}'
+    if not ag_path.exists():
+        ag_path.write_bytes(ag_bytes)
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(conn, lock, stop), daemon=True).start()
+    try:
+        while True:
+            with lock:
+                conn.send(('get',))
+            message = conn.recv()
+            if message[0] == 'stop':
+                break
+            _, key, file_name, data, options = message
+            submission_path = work_dir / file_name
+            submission_path.write_bytes(data)
+            try:
+                [(_, result, stats)] = list(pool.run([(key, (str(submission_path), str(ag_path), *options))], timeout))
+            finally:
+                submission_path.unlink()
+            LOGGER.info(f'graded {file_name}' if not isinstance(result, Exception) else f'grading {file_name} failed: {result}')
+            with lock:
+                try:
+                    conn.send(('result', key, result, stats))
+                except Exception:
+                    # the result (most likely an exception) could not be pickled
+                    conn.send(('result', key, RuntimeError(repr(result)), stats))
+    finally:
+        stop.set()
+
+def _serve_slot(address: tuple[str, int], authkey: bytes, name: str, max_tasks_per_worker: int, once: bool) -> None:
+    from .local_grader import LocalGrader
+    with tempfile.TemporaryDirectory(prefix='ograder_worker_') as work_dir, \
+         WorkerPool(LocalGrader.run_grade_submission, 1, max_tasks_per_worker, preload=PRELOAD_MODULES+['ograder.local_grader']) as pool:
+        while True:
+            try:
+                conn = Client(address, authkey=authkey)
+            except (OSError, EOFError):
+                time.sleep(RETRY_SECONDS)
+                continue
+            except AuthenticationError:
+                LOGGER.error(f'the coordinator {address[0]}:{address[1]} rejected the authkey')
+                return
+            LOGGER.info(f'{name} connected to {address[0]}:{address[1]}')
+            try:
+                _serve_connection(conn, pool, Path(work_dir), name)
+            except (EOFError, OSError) as e:
+                LOGGER.warning(f'{name} lost the connection to the coordinator: {e}')
+            finally:
+                conn.close()
+            if once:
+                return
+
+def serve(address: tuple[str, int], authkey: str, jobs: int=1, max_tasks_per_worker: int=DEFAULT_MAX_TASKS_PER_WORKER, once=False) -> None:
+    """
+    Runs jobs grading slots, each connects to the coordinator, fetches one submission after the other and grades it by a warm grading worker.
+    A slot (re)connects every RETRY_SECONDS, i.e., workers can be started before the coordinator and serve one grading after the other.
+
+    Args:
+        address (tuple[str, int]): (host, port) of the coordinator
+        authkey (str): shared secret of the coordinator and its workers
+        jobs (int, optional): number of submissions graded in parallel
+        max_tasks_per_worker (int, optional): number of submissions after which a grading worker is recycled
+        once (bool, optional): if True, return after the coordinator finished its grading instead of waiting for the next one
+    """
+    threads = []
+    for slot in range(max(1, jobs)):
+        name = f'{socket.gethostname()}-{os.getpid()}-{slot}'
+        thread = threading.Thread(target=_serve_slot, args=(address, authkey.encode('utf-8'), name, max_tasks_per_worker, once), daemon=True)
+        thread.start()
+        threads.append(thread)
+    # join with a timeout such that Ctrl+C is not blocked
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=1)
@@ -0,0 +1,75 @@
+import json
+import os
+
+from pathlib import Path
+
+from otter.utils import loggers
+
+LOGGER = loggers.get_logger(__name__)
+
+JOURNAL_FILE = 'journal.jsonl'
+
+STATUS_GRADED = 'graded'
+STATUS_FAILED = 'failed'
+STATUS_TIMEOUT = 'timeout'
+STATUS_MEMORY = 'memory'
+STATUS_INVALID = 'invalid'
+
+class Journal:
+
+    def __init__(self, path: Path):
+        """
+        Append-only, crash-safe record of the students of a grading run whose grading is finished.
+        Each line is a JSON object describing one student. Every line is flushed to disk as soon as it is written,
+        such that an interrupted run can be resumed without grading these students again.
+
+        Args:
+            path (Path): path to the journal file (usually grading_<timestamp>/journal.jsonl)
+        """
+        self.path: Path = Path(path)
+
+    def load(self) -> dict[str, dict]:
+        """
+        Reads all complete entries of the journal, a partially written last line (crash) is ignored.
+
+        Returns:
+            dict[str, dict]: maps the student zip file name to its journal entry
+        """
+        entries = {}
+        if not self.path.exists():
+            return entries
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    LOGGER.warning(f'ignoring incomplete journal entry in {self.path}')
+                    continue
+                entries[entry['file']] = entry
+        return entries
+
+    def append(self, student, status: str) -> None:
+        """
+        Appends the result of a student to the journal.
+
+        Args:
+            student (Student): the student whose grading is finished
+            status (str): one of STATUS_GRADED, STATUS_FAILED, STATUS_TIMEOUT, STATUS_MEMORY, STATUS_INVALID
+        """
+        entry = {
+            'name': student.name,
+            'forname': student.forname,
+            'file': str(student.file),
+            'status': status,
+            'carried_over': getattr(student, 'carried_over', False),
+            'questions': [[q.name, q.score, q.possible] for q in student.questions.values()]
+        }
+        with open(self.path, 'ab+') as f:
+            # terminate a partially written line of an interrupted run
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+            f.write((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
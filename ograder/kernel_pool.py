@@ -0,0 +1,245 @@
+import ast
+import atexit
+import json
+import tempfile
+import threading
+import zipfile
+
+from contextlib import contextmanager
+from pathlib import Path
+
+from otter.utils import loggers
+
+from .defaults import BACKEND_PROCESS, BACKEND_KERNEL, BACKENDS
+
+LOGGER = loggers.get_logger(__name__)
+
+DEFAULT_KERNEL_NAME = 'python3'
+STARTUP_TIMEOUT = 60 # seconds a kernel may take to start and to preload the imports
+READY_TIMEOUT = 10 # seconds a leased kernel may take to answer, otherwise it is considered hanging
+COMMON_IMPORT_SHARE = 0.5 # a module is preloaded if at least this share of the submissions imports it
+
+def _imports(source: str) -> set[str]:
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        # e.g. magics, the imports of the other cells still count
+        return set()
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules |= {alias.name for alias in node.names}
+        elif isinstance(node, ast.ImportFrom) and node.module != None and node.level == 0:
+            modules.add(node.module)
+    return modules
+
+def _notebook_imports(zf: zipfile.ZipFile) -> set[str]:
+    modules = set()
+    for info in zf.infolist():
+        if info.filename.endswith('.zip'):
+            with zf.open(info) as member, zipfile.ZipFile(member) as inner:
+                modules |= _notebook_imports(inner)
+        elif info.filename.endswith('.ipynb') and not info.filename.startswith('__MACOSX'):
+            try:
+                notebook = json.loads(zf.read(info))
+            except ValueError:
+                continue
+            for cell in notebook.get('cells', []):
+                source = cell.get('source', '')
+                if cell.get('cell_type') == 'code':
+                    modules |= _imports(''.join(source) if isinstance(source, list) else source)
+    return modules
+
+def common_imports(paths: list[Path], share: float=COMMON_IMPORT_SHARE) -> list[str]:
+    """
+    Collects the (absolute) imports of the notebooks of the submissions.
+
+    Args:
+        paths (list[Path]): paths to the (repackaged) submission zip files
+        share (float, optional): minimum share of the submissions which have to import a module
+
+    Returns:
+        list[str]: the modules imported by at least share of the submissions, sorted by name
+    """
+    counts = {}
+    for path in paths:
+        try:
+            with zipfile.ZipFile(path) as zf:
+                modules = _notebook_imports(zf)
+        except (OSError, zipfile.BadZipFile):
+            continue
+        for module in modules:
+            counts[module] = counts.get(module, 0) + 1
+    return sorted(module for module, count in counts.items() if count >= share * max(1, len(paths)))
+
+class KernelPool:
+
+    def __init__(self, size: int=1, preload: list[str]=[], kernel_name: str=DEFAULT_KERNEL_NAME):
+        """
+        Pre-started Jupyter kernels which are leased out to execute one notebook each.
+        A kernel is never reused: after its lease it is shut down and a fresh one is started in the background,
+        i.e., the startup of the next kernel and the import of the preload modules overlap with the grading,
+        while no state of a student can leak into the grading of the next one.
+        A kernel which does not answer when it is leased is killed and replaced.
+
+        Args:
+            size (int, optional): number of kernels kept ready
+            preload (list[str], optional): modules imported by every kernel before it is leased, modules which can not be imported are skipped
+            kernel_name (str, optional): name of the kernel spec
+        """
+        self.size = max(1, size)
+        self.preload = list(preload)
+        self.kernel_name = kernel_name
+        self.ready: list = []
+        self.starting: list[threading.Thread] = []
+        self.lock = threading.Lock()
+        self.closed = False
+        for _ in range(self.size):
+            self.__start_in_background()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __start(self):
+        from jupyter_client import KernelManager
+        km = KernelManager(kernel_name=self.kernel_name)
+        # the working directory of the grading changes (and vanishes) while a kernel starts in the background
+        km.start_kernel(cwd=tempfile.gettempdir())
+        kc = km.client()
+        kc.start_channels()
+        try:
+            kc.wait_for_ready(timeout=STARTUP_TIMEOUT)
+            if len(self.preload) > 0:
+                # the modules are imported into a throwaway namespace, a student who forgot an import still fails
+                source = '\n'.join(f'try:\n    import {module}\nexcept Exception:\n    pass' for module in self.preload)
+                kc.execute_interactive(f'exec({source!r}, {{}})', silent=True, store_history=False, timeout=STARTUP_TIMEOUT)
+        finally:
+            kc.stop_channels()
+        return km
+
+    def __start_and_add(self) -> None:
+        try:
+            km = self.__start()
+        except Exception as e:
+            LOGGER.warning(f'unable to start a {self.kernel_name} kernel: {e}')
+            return
+        with self.lock:
+            if self.closed:
+                km.shutdown_kernel(now=True)
+            else:
+                self.ready.append(km)
+
+    def __start_in_background(self) -> None:
+        thread = threading.Thread(target=self.__start_and_add, daemon=True)
+        thread.start()
+        with self.lock:
+            self.starting = [t for t in self.starting if t.is_alive()] + [thread]
+
+    def __take(self):
+        while True:
+            with self.lock:
+                if len(self.ready) > 0:
+                    return self.ready.pop(0)
+                starting = [t for t in self.starting if t.is_alive()]
+            if len(starting) == 0:
+                # the background start failed, start one in the foreground (and raise its error)
+                return self.__start()
+            starting[0].join()
+
+    def spare_pids(self) -> set[int]:
+        """
+        Returns:
+            set[int]: process ids of the kernels which are ready but not leased
+        """
+        with self.lock:
+            return {km.provisioner.pid for km in self.ready if km.provisioner != None and km.provisioner.pid != None}
+
+    @staticmethod
+    def __change_dir(km, cwd: str) -> None:
+        kc = km.client()
+        kc.start_channels()
+        try:
+            reply = kc.execute_interactive(f'__import__("os").chdir({str(cwd)!r})', silent=True, store_history=False, timeout=READY_TIMEOUT)
+            if reply['content']['status'] != 'ok':
+                raise RuntimeError(f'unable to change the working directory of the kernel to {cwd}')
+        finally:
+            kc.stop_channels()
+
+    @contextmanager
+    def lease(self, cwd: str):
+        """
+        Leases a ready kernel whose working directory is cwd. It is shut down (and replaced) when the lease ends.
+
+        Args:
+            cwd (str): working directory of the notebook
+
+        Yields:
+            KernelManager: manager of the running kernel
+        """
+        km = self.__take()
+        try:
+            self.__change_dir(km, cwd)
+        except Exception as e:
+            LOGGER.warning(f'killing the hanging kernel {km.provisioner.pid}: {e}')
+            km.shutdown_kernel(now=True)
+            km = self.__start()
+            self.__change_dir(km, cwd)
+        self.__start_in_background()
+        try:
+            yield km
+        finally:
+            km.shutdown_kernel(now=True)
+
+    def close(self) -> None:
+        """
+        Shuts down the ready kernels.
+        """
+        with self.lock:
+            self.closed = True
+            ready, self.ready = self.ready, []
+        for km in ready:
+            try:
+                km.shutdown_kernel(now=True)
+            except Exception:
+                pass
+
+_POOL: KernelPool = None
+
+def kernel_pool(preload: list[str]=[]) -> KernelPool:
+    """
+    Returns the kernel pool of this (grading worker) process, it is (re)created if the preload modules changed.
+    """
+    global _POOL
+    if _POOL == None or _POOL.preload != list(preload):
+        if _POOL != None:
+            _POOL.close()
+        _POOL = KernelPool(1, preload)
+    return _POOL
+
+@contextmanager
+def executing_by(km, kernel_name: str=DEFAULT_KERNEL_NAME):
+    """
+    Lets nbconvert's ExecutePreprocessor (used by otter) execute notebooks of the kernel kernel_name by the running kernel of km
+    instead of starting its own kernel. Notebooks of other kernels are executed as usual.
+    """
+    from nbconvert.preprocessors import ExecutePreprocessor
+    preprocess = ExecutePreprocessor.preprocess
+
+    def preprocess_by_kernel(self, nb, resources=None, _km=None):
+        if nb.metadata.get('kernelspec', {}).get('name', kernel_name) != kernel_name:
+            return preprocess(self, nb, resources, _km)
+        try:
+            return preprocess(self, nb, resources, km)
+        finally:
+            if self.kc != None:
+                self.kc.stop_channels()
+
+    ExecutePreprocessor.preprocess = preprocess_by_kernel
+    try:
+        yield
+    finally:
+        ExecutePreprocessor.preprocess = preprocess
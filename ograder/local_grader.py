@@ -1,23 +1,37 @@
 
 from pathlib import Path
-from otter.api import grade_submission
-from .utils import peek, is_empty
+import otter
+from .runner import grade_submission, limits_supported, stage_autograder, remove_staged, MemoryLimitExceeded, CpuLimitExceeded
+from .utils import peek, is_empty, cpu_count
 from otter.utils import loggers
 from otter.utils import chdir
 
 import warnings
 
 import time
+import csv
 import zipfile
-import tempfile
 import shutil
+import sqlite3
 
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
 import threading
-from multiprocessing import Process, Queue
+from .cache import ResultCache, content_hash
+from .results import ResultWriter, autograder_questions, read_result, OVERALL_POINTS_LABEL, CARRIED_OVER_LABEL
+from .timing import TimingWriter
+from .profiling import Profiler, merge_stats
+from .journal import Journal, JOURNAL_FILE, STATUS_GRADED, STATUS_FAILED, STATUS_TIMEOUT, STATUS_MEMORY, STATUS_INVALID
+from .worker_pool import WorkerPool, WorkerTimeout, WorkerCrash, TaskStats, PRELOAD_MODULES, DEFAULT_MAX_TASKS_PER_WORKER
+from .distributed import Coordinator
+from .schedule import GradingHistory, HISTORY_FILE, schedule, submission_features
+from .dedup import submission_hash, duplicate_groups, write_report
+from .prescreen import prescreen_all, read_template
+from .kernel_pool import BACKEND_PROCESS, BACKEND_KERNEL, common_imports, kernel_pool
+from .progress import Progress
+from .store import ResultStore
 import concurrent.futures
 import time
 
@@ -25,7 +39,10 @@ from dataclasses import dataclass, field
 
 LOGGER = loggers.get_logger(__name__)
 
-OVERALL_POINTS_LABEL = 'overall'
+COPY_BUFFER_SIZE = 1024 * 1024
+DUPLICATES_FILE = 'duplicates.csv'
+ERRORS_FILE = 'errors.csv'
+COMPRESSED_SUFFIXES = {'.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.png', '.jpg', '.jpeg', '.gif', '.mp3', '.mp4', '.whl'}
 
 @dataclass
 class Question():
@@ -40,6 +57,7 @@ class Student():
     forname: str
     questions:dict[str:Question] = field(default_factory=dict)
     file: Path = field(default_factory=Path)
+    carried_over: bool = False # the result has been taken from an earlier grading run
     
     def score_sum(self) -> float:
         s = 0
@@ -49,31 +67,119 @@ class Student():
 
     @staticmethod
     def to_dict(students:list, manual_questions:list[str]) -> dict:
-        d = {}
-        for i in range(len(students)):
-            student = students[i]
-            if i == 0:
-                d = {question_name: [] for question_name in student.questions}
-
-                for manual_question in manual_questions:
-                    d[manual_question] = []
-
-                d[OVERALL_POINTS_LABEL] = []
-                for v in vars(student):
-                    if v != 'questions':
-                        d[v] = []
-            for question_name in student.questions:
-                d[question_name].append(student.questions[question_name].score)
-
-            for manual_question in manual_questions:
-                d[manual_question].append(np.nan)
-
-            for v in vars(student):
-                if v != 'questions':
-                    d[v].append(vars(student)[v])
-
-            d[OVERALL_POINTS_LABEL].append(student.score_sum())
+        return ScoreMatrix.from_students(students).to_dict(manual_questions)
+
+@dataclass
+class ScoreMatrix():
+    """
+    Compact, array-backed representation of the scores of many students, i.e.,
+    a (students x questions) matrix of scores and one of possible points.
+    Missing scores (the student has no result for the question) are NaN.
+    """
+    questions: np.ndarray
+    names: np.ndarray
+    fornames: np.ndarray
+    files: np.ndarray
+    scores: np.ndarray
+    possible: np.ndarray
+    carried_over: np.ndarray = None # only present if the result marks the rows taken from an earlier grading run
+    
+    @staticmethod
+    def from_students(students:list[Student], questions:list[str]=None, carried_over=False) -> 'ScoreMatrix':
+        """
+        Args:
+            students (list[Student]): graded students
+            questions (list[str], optional): the columns, defaults to all questions of the students in the order of their appearance
+            carried_over (bool, optional): if True, the matrix contains whether the result of each student has been carried over
+
+        Returns:
+            ScoreMatrix: the scores of students
+        """
+        if questions == None or len(questions) == 0:
+            questions = list(dict.fromkeys(name for student in students for name in student.questions))
+        column = {name: j for j, name in enumerate(questions)}
+        scores = np.full((len(students), len(questions)), np.nan)
+        possible = np.full((len(students), len(questions)), np.nan)
+        for i, student in enumerate(students):
+            for question in student.questions.values():
+                j = column.get(question.name)
+                if j != None:
+                    scores[i, j] = question.score
+                    possible[i, j] = question.possible
+        return ScoreMatrix(
+            np.array(questions, dtype=object),
+            np.array([student.name for student in students], dtype=object),
+            np.array([student.forname for student in students], dtype=object),
+            np.array([str(student.file) for student in students], dtype=object),
+            scores,
+            possible,
+            np.array([student.carried_over for student in students], dtype=bool) if carried_over else None)
+    
+    def __len__(self) -> int:
+        return len(self.names)
+    
+    def totals(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: the overall score of each student
+        """
+        return np.nansum(self.scores, axis=1)
+    
+    def possible_totals(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: the overall possible points of each student
+        """
+        return np.nansum(self.possible, axis=1)
+    
+    def means(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: the mean score of each question (NaN if no student has a result for the question)
+        """
+        counts = np.sum(~np.isnan(self.scores), axis=0)
+        sums = np.nansum(self.scores, axis=0)
+        return np.divide(sums, counts, out=np.full(len(self.questions), np.nan), where=counts > 0)
+    
+    def histogram(self, bins=20) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            tuple[np.ndarray, np.ndarray]: counts and bin edges of the overall scores
+        """
+        return np.histogram(self.totals(), bins=bins)
+    
+    def sorted(self, by='name') -> 'ScoreMatrix':
+        """
+        Returns:
+            ScoreMatrix: the matrix with its rows (stable) sorted by the students name or by their total score (by='overall')
+        """
+        keys = self.totals() if by == OVERALL_POINTS_LABEL else self.names.astype(str)
+        order = np.argsort(keys, kind='stable')
+        return ScoreMatrix(self.questions, self.names[order], self.fornames[order], self.files[order], self.scores[order], self.possible[order],
+                           None if self.carried_over is None else self.carried_over[order])
+    
+    def to_dict(self, manual_questions:list[str]=[]) -> dict:
+        """
+        Returns the columns of the grading result: scores of the questions, manual questions (NaN), overall, name, forname, file and (if present) carried_over.
+        """
+        d = {name: self.scores[:, j] for j, name in enumerate(self.questions)}
+        for manual_question in manual_questions:
+            d[manual_question] = np.full(len(self), np.nan)
+        d[OVERALL_POINTS_LABEL] = self.totals()
+        d['name'] = self.names
+        d['forname'] = self.fornames
+        d['file'] = self.files
+        if self.carried_over is not None:
+            d[CARRIED_OVER_LABEL] = self.carried_over.astype(int)
         return d
+    
+    def to_dataframe(self, manual_questions:list[str]=[]) -> pd.DataFrame:
+        return pd.DataFrame(self.to_dict(manual_questions))
+    
+    def plot(self, bins=20) -> None:
+        plt.hist(self.totals(), bins=bins, alpha=0.5)
+        plt.xlabel(OVERALL_POINTS_LABEL)
+        plt.show()
 
 class LocalGrader:
 
@@ -90,16 +196,21 @@ class LocalGrader:
         self.src: Path = src
     
     @staticmethod
-    def wrapper_grade_submission(queue:Queue, func, submission_path:Path, ag_path:str, quiet:bool, debug:bool):
-        try:
-            ret = func(submission_path, ag_path, quiet, debug)
-            result_dict = ret.to_dict()
-            questions = {}
-            for test_name in ret.results:
-                questions[test_name] = Question(test_name, float(result_dict[test_name]['score']), float(result_dict[test_name]['possible']))
-            queue.put(questions)
-        except Exception as e:
-            queue.put(e)
+    def run_grade_submission(submission_path:str, ag_path:str, quiet:bool, debug:bool, memory_limit:int=None, cpu_limit:float=None, preload:list[str]=None) -> tuple[dict[str, Question], dict[str, float], int]:
+        """
+        Grades a single submission, this is executed inside a grading worker.
+        The kernel executing the notebook is killed if it exceeds memory_limit (bytes, RSS) or cpu_limit (seconds of CPU time).
+        If preload is given (kernel backend), the notebook is executed by a pre-started kernel of the worker's KernelPool which imported the preload modules.
+
+        Returns:
+            tuple[dict[str, Question], dict[str, float], int]: the questions, the seconds spent in each grading phase and the peak memory in bytes
+        """
+        ret, timings, peak_rss = grade_submission(submission_path, ag_path, quiet, debug, memory_limit, cpu_limit, None if preload == None else kernel_pool(preload))
+        result_dict = ret.to_dict()
+        questions = {}
+        for test_name in ret.results:
+            questions[test_name] = Question(test_name, float(result_dict[test_name]['score']), float(result_dict[test_name]['possible']))
+        return questions, timings, peak_rss
     
     @staticmethod
     def __extract_student(student_dir:Path) -> Student:
@@ -113,73 +224,155 @@ class LocalGrader:
         return Student(student_name[0], ' '.join(student_name[1:]))
     
     @staticmethod
-    def handle_error(error_dir:Path, student:Student, student_zip_path:Path):
-        new_path = error_dir / Path(student.file)
-        LOGGER.error(f'Unable to grade {student.file}, therefore moving the file to {new_path}')
+    def handle_error(error_dir:Path, student:Student, student_zip_path:Path, status:str=STATUS_FAILED, reason:str='', peak_rss:int=None):
+        """
+        Moves the submission of a student whose grading failed to error_dir/status and records the failure in error_dir/errors.csv.
+        """
+        (error_dir / Path(status)).mkdir(exist_ok=True)
+        new_path = error_dir / Path(status) / Path(student.file)
+        LOGGER.error(f'Unable to grade {student.file} ({status}), therefore moving the file to {new_path}')
         student_zip_path.rename(new_path)
+        errors_path = error_dir / Path(ERRORS_FILE)
+        write_header = not errors_path.exists()
+        with open(errors_path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, delimiter=';')
+            if write_header:
+                writer.writerow(['name', 'forname', 'file', 'status', 'reason', 'peak_rss_mb'])
+            writer.writerow([student.name, student.forname, str(student.file), status, reason, '' if peak_rss == None else round(peak_rss / (1024 * 1024), 1)])
+    
+    def grade(self, manual_questions:list[str]=[], moodle_assignment=True, timeount_in_seconds:float=None, plot=False, jobs:int=None, max_tasks_per_worker:int=DEFAULT_MAX_TASKS_PER_WORKER, use_cache=True, resume:Path=None, parquet=False, profile=False, profile_workers=False, coordinator:tuple[str, int]=None, authkey:str=None, dedup=True, memory_limit_mb:float=None, cpu_limit:float=None, backend:str=BACKEND_PROCESS, prescreen=True, template:Path=None, since:Path=None, progress_file:Path=None, store:Path=None, semester:str=''):
+        if not moodle_assignment:
+            LOGGER.error(f'Only moodle assignments are supported right now. If it is a moodle assignment it is possible to extract the students name.')
+            return
+        
+        with Profiler(self.src / Path('grading'), enabled=profile) as profiler:
+            run = self.prepare(manual_questions, timeount_in_seconds, use_cache, resume, parquet, dedup, memory_limit_mb, cpu_limit, backend, prescreen, template, since, store, semester)
+            if run == None:
+                return
+            profiler.prefix = run.grading_dir
+            
+            profile_dir = None
+            if profile_workers:
+                profile_dir = run.grading_dir.parent / Path(f'{run.grading_dir.name}_worker_profiles')
+                profile_dir.mkdir(exist_ok=True)
+            
+            with run:
+                if coordinator != None:
+                    pool = Coordinator(run.autograder_zip, coordinator, authkey)
+                else:
+                    pool = LocalGrader.create_pool(jobs, max_tasks_per_worker, profile_dir)
+                LocalGrader.grade_runs([run], pool, timeount_in_seconds, progress_file)
+            
+            if profile_dir != None:
+                merge_stats(sorted(profile_dir.glob('task_*.pstats')), profile_dir.with_suffix('.pstats'))
+        
+        if plot:
+            print(run.scores.to_dataframe(manual_questions))
+            run.scores.plot(bins=20)
     
-    def grade(self, manual_questions:list[str]=[], moodle_assignment=True, timeount_in_seconds:float=None, plot=False):
+    def prepare(self, manual_questions:list[str]=[], timeount_in_seconds:float=None, use_cache=True, resume:Path=None, parquet=False, dedup=True, memory_limit_mb:float=None, cpu_limit:float=None, backend:str=BACKEND_PROCESS, prescreen=True, template:Path=None, since:Path=None, store:Path=None, semester:str='') -> 'GradingRun':
+        """
+        Prepares the grading of the (Moodle) submissions: creates the grading directory (or reuses the one given by resume),
+        splits the Moodle zip file into the otter zip files of the students and determines which submissions have to be graded.
+        If since is given, only the submissions which are new or changed compared to the grading directory since are graded.
+        If store is given, the result is additionally written to this result database (see store.ResultStore) as assignment self.src.name of semester.
+
+        Returns:
+            GradingRun: the grading of the submissions or None if they can not be graded
+        """
         autograder_zip, _ = peek(self.autograde.rglob('*.zip'))
         if autograder_zip == None:
             LOGGER.error(f'autograde zip file is missing, you may have to execute ograder assign [assignment name]')
-            return
+            return None
+        
+        if (memory_limit_mb != None or cpu_limit != None) and not limits_supported():
+            LOGGER.error(f'memory and CPU limits require psutil, you may have to execute pip install psutil')
+            return None
+        
+        if resume != None:
+            resume = Path(resume).resolve()
+            if not (resume / Path(JOURNAL_FILE)).exists():
+                LOGGER.error(f'there is no grading journal in {resume}, therefore the grading can not be resumed')
+                return None
+        
+        if since != None:
+            since = Path(since).resolve()
+            if not (since / Path(JOURNAL_FILE)).exists() and len(list(since.glob('grading_result_*.csv'))) == 0:
+                LOGGER.error(f'there is neither a grading journal nor a grading result in {since}, therefore no result can be carried over')
+                return None
         
         # check if there is exactly one submssion zip-file (containing all student assignments)
-        if len(list((self.src.glob('*.zip')))) == 1:
-            print(self.src)
-            with chdir(self.src):
-                time_str = time.strftime("%Y%m%d_%H%M%S")
-                grading_dir = Path(f'grading_{time_str}')
-                grading_dir.mkdir()
-                
-                error_dir = Path(grading_dir / Path('errors'))
-                error_dir.mkdir()
-                
-                zip_file, _ = peek(self.src.glob('*.zip'))
-                if moodle_assignment:
-                    valid_students = [] # grading was succesful
-                    error_students = [] # grading timed out
-                    
-                    # extract students information from the path generated by Moodle
-                    print(zip_file)
-                    students = self.__pase_moodle_zip(zip_file, grading_dir)
-                    
-                    for student in students:
-                        LOGGER.info(f'grading {student}')
-                        student_zip_path = grading_dir / Path(student.file)
-                        
-                        queue = Queue()
-                        process = Process(target=LocalGrader.wrapper_grade_submission, args=(queue, grade_submission, student_zip_path, str(autograder_zip), False, False))
-                        process.start()
-                        process.join(timeout=timeount_in_seconds)
-                        
-                        if process.is_alive():
-                            LOGGER.info(f'grading {student} timed out')
-                            process.terminate()
-                            process.join()
-                            LocalGrader.handle_error(error_dir, student, student_zip_path)
-                            error_students.append(student)
-                        else:
-                            questions = queue.get()
-                            if isinstance(questions, Exception):
-                                LOGGER.error(f'grading {student} was unsucessful due to {questions}')
-                                LocalGrader.handle_error(error_dir, student, student_zip_path)
-                                error_students.append(student)
-                            else:
-                                student.questions = questions
-                                valid_students.append(student)
-                                
-                    data = pd.DataFrame(Student.to_dict(valid_students, manual_questions)).sort_values('name')
-                    data.to_csv(grading_dir / Path(f'grading_result_{time_str}.csv'), sep=';')
-                    LOGGER.info(data)
-                    
-                    if plot:
-                        print(data)
-                        data['overall'].plot.hist(bins=20, alpha=0.5)
-                        plt.show()
-                    
-                else:
-                    LOGGER.error(f'Only moodle assignments are supported right now. If it is a moodle assignment it is possible to extract the students name.')
+        if len(list((self.src.glob('*.zip')))) != 1:
+            LOGGER.error(f'there has to be exactly one (Moodle) zip file in {self.src}')
+            return None
+        
+        print(self.src)
+        src = self.src.resolve()
+        if resume != None:
+            grading_dir = resume
+            time_str = grading_dir.name[len('grading_'):]
+            LOGGER.info(f'resume grading in {grading_dir}')
+        else:
+            time_str = time.strftime("%Y%m%d_%H%M%S")
+            grading_dir = src / Path(f'grading_{time_str}')
+            grading_dir.mkdir()
+        
+        zip_file, _ = peek(src.glob('*.zip'))
+        # extract students information from the path generated by Moodle
+        print(zip_file)
+        students = self.__pase_moodle_zip(zip_file, grading_dir)
+        try:
+            return GradingRun(students, autograder_zip.resolve(), grading_dir, time_str, manual_questions, timeount_in_seconds,
+                              ResultCache() if use_cache else None, GradingHistory(src / Path(HISTORY_FILE)), dedup,
+                              None if memory_limit_mb == None else int(memory_limit_mb * 1024 * 1024), cpu_limit, parquet, backend, prescreen, template, since, store, semester, self.src.name)
+        except ValueError as e:
+            LOGGER.error(f'{e}, you may have to execute ograder assign [assignment name]')
+            return None
+    
+    @staticmethod
+    def create_pool(jobs:int=None, max_tasks_per_worker:int=DEFAULT_MAX_TASKS_PER_WORKER, profile_dir:Path=None) -> WorkerPool:
+        """
+        Creates a pool of up to jobs warm grading workers, i.e., processes which imported otter once and grade many submissions.
+
+        Args:
+            jobs (int, optional): number of submissions graded in parallel, defaults to the number of usable cores
+            max_tasks_per_worker (int, optional): number of submissions after which a worker is recycled
+            profile_dir (Path, optional): if given, the grading inside the workers is profiled and the statistics are written to this directory
+        """
+        if jobs == None or jobs < 1:
+            jobs = cpu_count()
+        LOGGER.info(f'grading by {jobs} parallel job(s)')
+        return WorkerPool(LocalGrader.run_grade_submission, jobs, max_tasks_per_worker, preload=PRELOAD_MODULES+[__name__], profile_dir=None if profile_dir == None else str(profile_dir))
+    
+    @staticmethod
+    def grade_runs(runs:list['GradingRun'], pool, timeount_in_seconds:float=None, progress_file:Path=None) -> None:
+        """
+        Grades the submissions of all runs (of possibly different assignments) by one pool, longest-expected-first across all runs.
+        A worker whose submission exceeds timeount_in_seconds is killed and replaced.
+        The submissions which are likely to time out are graded in a separate lane.
+        The progress is shown while grading (see progress.Progress).
+
+        Args:
+            runs (list[GradingRun]): the prepared gradings
+            pool (WorkerPool | Coordinator): the pool which executes LocalGrader.run_grade_submission, a Coordinator only supports a single run
+            timeount_in_seconds (float, optional): time after the grading of a single submission will be terminated
+            progress_file (Path, optional): file to which the progress is written, JSON lines or, if it ends with .prom, the Prometheus text format
+        """
+        tasks, expected, slow = [], {}, set()
+        for r, run in enumerate(runs):
+            for i, args in run.tasks():
+                tasks.append(((r, i), args))
+                expected[(r, i)] = run.expected.get(i, 0.0)
+            slow |= {(r, i) for i in run.slow}
+        tasks.sort(key=lambda task: -expected[task[0]])
+        LOGGER.info(f'grading {len(tasks)} submissions of {len(runs)} assignment(s)')
+        
+        total = sum(len(runs[r].groups[i]) for (r, i), _ in tasks)
+        label = lambda key: str(runs[key[0]].students[key[1]].file)
+        with pool, Progress(total, pool, label, progress_file) as progress:
+            for (r, i), result, stats in pool.run(tasks, timeout=timeount_in_seconds, slow=slow):
+                progress.update(runs[r].handle(i, result, stats))
+            LOGGER.info(pool.summary())
         
     def __pase_moodle_zip(self, moodle_zip: Path, grading_dir: Path) -> list[Student]:
         """
@@ -197,50 +390,353 @@ class LocalGrader:
                 student_b_zip
         where the file name is used to identify the student!
         This method extracts the student name from the cryptic directory name and rearranges the zip files or zips the files accordingly.
+        The moodle zip file is streamed, i.e., nothing is extracted to the disk and each otter zip file is written in one pass.
+        Files which are already compressed, e.g., the student zip files, are stored without compressing them again.
         
         Args:
             moodle_zip (Path): path to the moodle zip file
+            grading_dir (Path): directory to which the otter zip files of the students are written
 
         Returns:
-            Path: converts a moodle assignment zip file into a valid otter assignment zip that contains all the files.
+            list[Student]: the students whose otter zip file has been written to grading_dir
         """
         students = []
-        #with chdir(moodle_zip.parent):
-        tmp = tempfile.mkdtemp() # temp directory
         with zipfile.ZipFile(moodle_zip) as zf:
-            zf.extractall(tmp)
-            for student_dir in Path(tmp).iterdir():
-                if student_dir.is_dir() and not str(student_dir).endswith('__MACOSX'):
-                    #print(f'student dir: {student_dir}')
-                    student = LocalGrader.__extract_student(student_dir)
-                    
-                    new_zip_path = Path(student.name+'_'+'_'.join(student.forname.split(' '))+'.zip')
-                    
-                    student.file = new_zip_path
-                    students.append(student)
+            # group the members by their (top level) student directory without extracting anything
+            student_members = {}
+            for info in zf.infolist():
+                parts = info.filename.split('/')
+                if len(parts) < 2 or parts[0].endswith('__MACOSX') or info.is_dir():
+                    continue
+                student_members.setdefault(parts[0], []).append(info)
+            
+            for student_dir_name, members in student_members.items():
+                student = LocalGrader.__extract_student(Path(student_dir_name))
+                new_zip_path = Path(student.name+'_'+'_'.join(student.forname.split(' '))+'.zip')
+                student.file = new_zip_path
+                students.append(student)
+                
+                # either the student assignment consist of a single zip file, this should be the default case!
+                zip_info, _ = peek(info for info in members if info.filename.endswith('.zip'))
+                force_zip64 = sum(info.file_size for info in members) > zipfile.ZIP64_LIMIT
+                
+                with zipfile.ZipFile(grading_dir / new_zip_path, 'w', zipfile.ZIP_DEFLATED) as otter_zip:
+                    otter_zip.writestr('PersDaten.txt', f'{student}')
                     
-                    zip_path, _ = peek(student_dir.rglob('*.zip'))
-
-                    # either the student assignment consist of a single zip file, this should be the default case!
-                    if zip_path != None:
-                        #print(f'renaming {zip_path} to {new_zip_path}')
-                        zip_path.rename(new_zip_path)
+                    # the student zip is already compressed, therefore it is stored as it is
+                    student_zip_info = zipfile.ZipInfo(str(new_zip_path), date_time=time.localtime()[:6] if zip_info == None else zip_info.date_time)
+                    student_zip_info.compress_type = zipfile.ZIP_STORED
+                    if zip_info != None:
+                        student_zip_info.file_size = zip_info.file_size
+                        with zf.open(zip_info) as src, otter_zip.open(student_zip_info, 'w', force_zip64=force_zip64) as dest:
+                            shutil.copyfileobj(src, dest, COPY_BUFFER_SIZE)
                     # or the student assignment consist of many files, i.e. there is no zip
                     else:
-                        with zipfile.ZipFile(new_zip_path, 'w', zipfile.ZIP_DEFLATED) as new_student_zip:
-                            for file in student_dir.iterdir():
-                                #print(f'adding {file.relative_to(file.parent)} to {new_zip_path}')
-                                new_student_zip.write(file, file.relative_to(file.parent))
-                    
-                    tmp_path = Path('tmp.zip')
-                    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as tmp_zip:
-                        pers_info_path = Path('PersDaten.txt')
-                        with open(pers_info_path, 'w') as f:
-                            f.write(f'{student}')
-                        tmp_zip.write(pers_info_path)
-                        tmp_zip.write(new_zip_path)
-                        pers_info_path.unlink()
-                        new_zip_path.unlink()
-                        tmp_path.rename(new_zip_path)
-                    new_zip_path.rename(grading_dir / new_zip_path)
-            return students
\ No newline at end of file
+                        with otter_zip.open(student_zip_info, 'w', force_zip64=force_zip64) as dest:
+                            with zipfile.ZipFile(dest, 'w', zipfile.ZIP_DEFLATED) as student_zip:
+                                for info in members:
+                                    member_info = zipfile.ZipInfo(info.filename[len(student_dir_name)+1:], date_time=info.date_time)
+                                    member_info.compress_type = zipfile.ZIP_STORED if Path(info.filename).suffix.lower() in COMPRESSED_SUFFIXES else zipfile.ZIP_DEFLATED
+                                    member_info.file_size = info.file_size
+                                    with zf.open(info) as src, student_zip.open(member_info, 'w', force_zip64=force_zip64) as member_dest:
+                                        shutil.copyfileobj(src, member_dest, COPY_BUFFER_SIZE)
+            return students
+
+class GradingRun:
+
+    def __init__(self, students:list[Student], autograder_zip:Path, grading_dir:Path, time_str:str, manual_questions:list[str]=[], timeount_in_seconds:float=None, cache:ResultCache=None, history:GradingHistory=None, dedup=True, memory_limit:int=None, cpu_limit:float=None, parquet=False, backend:str=BACKEND_PROCESS, prescreen=True, template:Path=None, since:Path=None, store:Path=None, semester:str='', assignment:str=''):
+        """
+        The grading of the students of one assignment. It replays the journal of an interrupted run, carries over the results of an earlier run, looks up cached results,
+        groups identical submissions and orders the remaining submissions longest-expected-first, such that tasks() contains only the submissions
+        which have to be graded. Each result is passed to handle, which writes it to the journal, the result and the timing file.
+        The autograder is extracted and validated once (see runner.stage_autograder), every submission is graded against the staged tree.
+        Closing the run writes the final (sorted) result and removes the staged autograder.
+        A kernel which exceeds the memory limit is killed and the submission is moved to errors/memory,
+        a kernel which exceeds the CPU limit is treated like a timeout.
+
+        Args:
+            students (list[Student]): students whose (repackaged) submission is contained in grading_dir
+            autograder_zip (Path): path to the autograder zip file
+            grading_dir (Path): directory containing the student zip files, the results are written to it
+            time_str (str): timestamp of the grading used in the names of the result files
+            manual_questions (list[str], optional): names of the questions which are graded manually
+            timeount_in_seconds (float, optional): time after the grading of a single submission will be terminated
+            cache (ResultCache, optional): cache of earlier grading results, submissions with a cached result are not graded again
+            history (GradingHistory, optional): grading times of earlier runs, it is updated by the grading times of this run
+            dedup (bool, optional): grade identical submissions (see dedup.submission_hash) only once and list them in grading_dir/duplicates.csv
+            memory_limit (int, optional): maximum memory (RSS) in bytes of the kernel grading a submission
+            cpu_limit (float, optional): maximum CPU time in seconds of the kernel grading a submission
+            parquet (bool, optional): additionally write the result in the Parquet format
+            backend (str, optional): BACKEND_PROCESS (otter starts a kernel for each submission) or BACKEND_KERNEL (each worker leases pre-started kernels
+                which imported the modules imported by most submissions, see kernel_pool.KernelPool)
+            prescreen (bool, optional): check the submissions without executing them (see prescreen.prescreen) and move the invalid ones to errors/invalid
+            template (Path, optional): student notebook handed out, a submission which does not differ from it is invalid
+            since (Path, optional): grading directory of an earlier run of the same assignment, the result of a student who has been graded successfully
+                by it is carried over if the submission did not change (see dedup.submission_hash), the result file marks these students
+            store (Path, optional): result database (see store.ResultStore) to which the result is written when the run is closed
+            semester (str, optional): semester of the assignment in the result database
+            assignment (str, optional): name of the assignment in the result database
+
+        Raises:
+            ValueError: if autograder_zip is not an otter autograder
+        """
+        self.students = students
+        self.autograder_zip: Path = Path(autograder_zip)
+        self.grading_dir: Path = Path(grading_dir)
+        self.manual_questions = manual_questions
+        self.timeount_in_seconds = timeount_in_seconds
+        self.cache = cache
+        self.history = history
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.backend = backend
+        self.store: Path = store
+        self.semester = semester
+        self.assignment = assignment
+        self.time_str = time_str
+        self.preload: list[str] = None
+        stage_autograder(str(self.autograder_zip))
+        self.error_dir: Path = self.grading_dir / Path('errors')
+        self.error_dir.mkdir(exist_ok=True)
+        self.journal = Journal(self.grading_dir / Path(JOURNAL_FILE))
+        self.writer = ResultWriter(self.grading_dir / Path(f'grading_result_{time_str}.csv'), autograder_questions(self.autograder_zip), manual_questions, parquet=parquet, carried_over=since != None)
+        self.timing_writer = TimingWriter(self.grading_dir / Path(f'grading_timing_{time_str}.csv'), self.grading_dir / Path(f'grading_timing_summary_{time_str}.json'))
+        self.graded = [False] * len(students) # True if grading was succesful, False otherwise
+        self.finished = [False] * len(students) # True if there is nothing left to do for the student
+        self.cache_keys = [None] * len(students)
+        self.groups: dict[int, list[int]] = {} # the graded submission and its identical submissions
+        self.expected: dict[int, float] = {} # expected grading time in seconds
+        self.slow: set[int] = set() # submissions which are likely to time out
+        self.order: list[int] = []
+        self.scores: ScoreMatrix = None
+        
+        self.__replay_journal()
+        if since != None:
+            self.__carry_over(Path(since))
+        self.__lookup_cache()
+        if prescreen:
+            self.__prescreen(None if template == None else read_template(template))
+        self.__group_duplicates(dedup)
+        self.__schedule()
+        if backend == BACKEND_KERNEL:
+            self.preload = common_imports([self.grading_dir / Path(self.students[i].file) for i in self.order])
+            LOGGER.info(f'the kernels preload {", ".join(self.preload) if len(self.preload) > 0 else "no modules"}')
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+    
+    def __replay_journal(self) -> None:
+        entries = self.journal.load()
+        for i, student in enumerate(self.students):
+            entry = entries.get(str(student.file))
+            if entry != None:
+                self.finished[i] = True
+                self.graded[i] = entry['status'] == STATUS_GRADED
+                student.questions = {name: Question(name, score, possible) for name, score, possible in entry['questions']}
+                student.carried_over = entry.get('carried_over', False)
+                # the submission of a failed student has been moved to the error directory by the interrupted run
+                student_zip_path = self.grading_dir / Path(student.file)
+                if not self.graded[i] and (self.error_dir / Path(entry['status']) / Path(student.file)).exists() and student_zip_path.exists():
+                    student_zip_path.unlink()
+                if self.graded[i]:
+                    self.writer.write(student)
+        if len(entries) > 0:
+            LOGGER.info(f'{sum(self.finished)} of {len(self.students)} students are already contained in {self.journal.path}')
+    
+    def __previous_results(self, since:Path) -> dict[str, dict[str, Question]]:
+        # the results of the successfully graded students of the earlier run, its journal contains the possible points as well
+        entries = Journal(since / Path(JOURNAL_FILE)).load()
+        if len(entries) > 0:
+            return {file: {name: Question(name, score, possible) for name, score, possible in entry['questions']} for file, entry in entries.items() if entry['status'] == STATUS_GRADED}
+        result_path = max(since.glob('grading_result_*.csv'), default=None)
+        if result_path == None:
+            return {}
+        return {file: {name: Question(name, score, np.nan) for name, score in scores.items()} for file, scores in read_result(result_path, self.writer.questions).items()}
+    
+    def __carry_over(self, since:Path) -> None:
+        previous = self.__previous_results(since)
+        carried = 0
+        for i, student in enumerate(self.students):
+            if self.finished[i] or str(student.file) not in previous:
+                continue
+            previous_zip_path = since / Path(student.file)
+            if not previous_zip_path.exists():
+                continue
+            try:
+                # the repackaged zip files differ by their timestamps, i.e., their content has to be compared
+                unchanged = submission_hash(self.grading_dir / Path(student.file)) == submission_hash(previous_zip_path)
+            except (OSError, zipfile.BadZipFile):
+                unchanged = False
+            if unchanged:
+                student.questions = previous[str(student.file)]
+                student.carried_over = True
+                self.graded[i] = True
+                self.finished[i] = True
+                carried += 1
+                self.journal.append(student, STATUS_GRADED)
+                self.writer.write(student)
+        LOGGER.info(f'carried over {carried} of {len(self.students)} results from {since}, {len(self.students) - sum(self.finished)} submissions are new or changed')
+    
+    def __lookup_cache(self) -> None:
+        if self.cache == None:
+            return
+        autograder_hash = content_hash(self.autograder_zip)
+        hits = 0
+        for i, student in enumerate(self.students):
+            if self.finished[i]:
+                continue
+            self.cache_keys[i] = ResultCache.key(content_hash(self.grading_dir / Path(student.file)), autograder_hash, otter.__version__)
+            cached = self.cache.get(self.cache_keys[i])
+            if cached != None:
+                LOGGER.info(f'found cached result of {student}')
+                student.questions = {name: Question(name, score, possible) for name, score, possible in cached}
+                self.graded[i] = True
+                self.finished[i] = True
+                hits += 1
+                self.journal.append(student, STATUS_GRADED)
+                self.writer.write(student)
+        LOGGER.info(f'{hits} of {len(self.students)} results are cached')
+    
+    def __prescreen(self, template:list[str]=None) -> None:
+        remaining = [i for i in range(len(self.students)) if not self.finished[i]]
+        start = time.perf_counter()
+        findings = prescreen_all([self.grading_dir / Path(self.students[i].file) for i in remaining], template)
+        invalid = 0
+        for i, finding in zip(remaining, findings):
+            if finding != None:
+                student = self.students[i]
+                LOGGER.info(f'{student.file} is invalid: {finding}')
+                LocalGrader.handle_error(self.error_dir, student, self.grading_dir / Path(student.file), STATUS_INVALID, str(finding))
+                self.journal.append(student, STATUS_INVALID)
+                self.finished[i] = True
+                invalid += 1
+        LOGGER.info(f'pre-screened {len(remaining)} submissions in {time.perf_counter() - start:.2f}s, {invalid} are invalid')
+    
+    def __group_duplicates(self, dedup:bool) -> None:
+        # group identical submissions, only the first submission of each group is graded
+        self.groups = {i: [i] for i in range(len(self.students)) if not self.finished[i]}
+        if not dedup:
+            return
+        hashes = []
+        for student in self.students:
+            try:
+                hashes.append(submission_hash(self.grading_dir / Path(student.file)))
+            except (OSError, zipfile.BadZipFile):
+                hashes.append(None)
+        duplicates = duplicate_groups(hashes)
+        n_groups = write_report(self.grading_dir / Path(DUPLICATES_FILE), self.students, duplicates)
+        LOGGER.info(f'found {n_groups} group(s) of identical submissions, see {self.grading_dir / Path(DUPLICATES_FILE)}')
+        for members in duplicates.values():
+            members = [i for i in members if not self.finished[i]]
+            if len(members) > 1:
+                for i in members:
+                    del self.groups[i]
+                self.groups[members[0]] = members
+    
+    def __schedule(self) -> None:
+        self.order = sorted(self.groups.keys())
+        if self.history == None:
+            return
+        features = [submission_features(self.grading_dir / Path(self.students[i].file)) for i in self.order]
+        order, slow_positions, estimates = schedule([str(self.students[i].file) for i in self.order], features, self.history, self.timeount_in_seconds)
+        self.expected = {i: float(estimate) for i, estimate in zip(self.order, estimates)}
+        self.slow = {self.order[j] for j in slow_positions}
+        self.order = [self.order[j] for j in order]
+        if len(self.slow) > 0:
+            LOGGER.info(f'{len(self.slow)} submission(s) are likely to time out and are graded in a separate lane: {", ".join(str(self.students[i].file) for i in sorted(self.slow))}')
+    
+    def tasks(self) -> list[tuple[int, tuple]]:
+        """
+        Returns:
+            list[tuple[int, tuple]]: (student index, arguments of LocalGrader.run_grade_submission) of each submission which has to be graded, in grading order
+        """
+        return [(i, (str(self.grading_dir / Path(self.students[i].file)), str(self.autograder_zip), False, False, self.memory_limit, self.cpu_limit, self.preload)) for i in self.order]
+    
+    def handle(self, i:int, result, stats:TaskStats) -> list[str]:
+        """
+        Processes the result of a grading task, i.e., the return value of LocalGrader.run_grade_submission or an exception.
+        The result of the graded submission is used for all identical submissions.
+
+        Args:
+            i (int): index of the graded student
+            result: the result of the task
+            stats (TaskStats): measurements of the pool
+
+        Returns:
+            list[str]: the status of each student of the group of i (see journal)
+        """
+        timings, peak_rss = {'total': stats.wall_seconds}, None
+        if isinstance(result, Exception):
+            questions = result
+            peak_rss = getattr(result, 'peak_rss', None)
+        else:
+            questions, worker_timings, peak_rss = result
+            timings.update(worker_timings)
+            timings['transfer'] = stats.transfer_seconds
+        statuses = []
+        for j in self.groups[i]:
+            student = self.students[j]
+            if self.history != None and not isinstance(result, WorkerCrash):
+                self.history.update(str(student.file), stats.wall_seconds, stats.timed_out)
+            student_zip_path = self.grading_dir / Path(student.file)
+            if isinstance(questions, (WorkerTimeout, CpuLimitExceeded)):
+                LOGGER.info(f'grading {student} timed out')
+                status = STATUS_TIMEOUT
+                LocalGrader.handle_error(self.error_dir, student, student_zip_path, status, str(questions), peak_rss)
+            elif isinstance(questions, MemoryLimitExceeded):
+                LOGGER.info(f'grading {student} exceeded the memory limit')
+                status = STATUS_MEMORY
+                LocalGrader.handle_error(self.error_dir, student, student_zip_path, status, str(questions), peak_rss)
+            elif isinstance(questions, Exception):
+                LOGGER.error(f'grading {student} was unsucessful due to {questions}')
+                status = STATUS_FAILED
+                LocalGrader.handle_error(self.error_dir, student, student_zip_path, status, str(questions), peak_rss)
+            else:
+                LOGGER.info(f'graded {student}' if j == i else f'graded {student} by the identical submission {self.students[i].file}')
+                student.questions = {name: Question(q.name, q.score, q.possible) for name, q in questions.items()}
+                self.graded[j] = True
+                status = STATUS_GRADED
+                if self.cache != None:
+                    self.cache.put(self.cache_keys[j], [(q.name, q.score, q.possible) for q in questions.values()])
+                self.writer.write(student)
+            self.journal.append(student, status)
+            statuses.append(status)
+            if j == i:
+                self.timing_writer.write(student, status, timings, peak_rss, stats.timed_out or isinstance(questions, CpuLimitExceeded))
+        return statuses
+    
+    def valid_students(self) -> list[Student]:
+        """the successfully graded students"""
+        return [student for i, student in enumerate(self.students) if self.graded[i]]
+    
+    def error_students(self) -> list[Student]:
+        """the students whose grading failed or timed out"""
+        return [student for i, student in enumerate(self.students) if not self.graded[i]]
+    
+    def close(self) -> ScoreMatrix:
+        """
+        Writes the final result sorted by the students name and the timing summary.
+
+        Returns:
+            ScoreMatrix: the scores of the successfully graded students
+        """
+        if self.scores != None:
+            return self.scores
+        if self.history != None:
+            self.history.save()
+        remove_staged(str(self.autograder_zip))
+        self.scores = ScoreMatrix.from_students(self.valid_students(), self.writer.questions, carried_over=self.writer.carried_over).sorted()
+        self.writer.close(self.scores)
+        self.timing_writer.close()
+        if self.store != None:
+            try:
+                with ResultStore(self.store) as store:
+                    store.add_run(self.semester, self.assignment, self.grading_dir, self.time_str, self.valid_students(), self.writer.questions)
+            except sqlite3.Error as e:
+                LOGGER.error(f'unable to write the result to {self.store}: {e}')
+        LOGGER.info(self.scores.to_dataframe(self.manual_questions))
+        LOGGER.info(f'mean scores: {dict((question, round(float(mean), 2)) for question, mean in zip(self.scores.questions, self.scores.means()))}')
+        return self.scores
@@ -0,0 +1,164 @@
+import ast
+import concurrent.futures
+import zipfile
+
+from dataclasses import dataclass
+from pathlib import Path
+
+import nbformat
+
+from otter.utils import loggers
+
+from .utils import cpu_count
+
+LOGGER = loggers.get_logger(__name__)
+
+REASON_INVALID_ZIP = 'invalid_zip'
+REASON_NO_NOTEBOOK = 'no_notebook'
+REASON_MULTIPLE_NOTEBOOKS = 'multiple_notebooks'
+REASON_INVALID_NOTEBOOK = 'invalid_notebook'
+REASON_SYNTAX_ERRORS = 'syntax_errors'
+REASON_EMPTY_TEMPLATE = 'empty_template'
+
+MIN_PARALLEL = 32 # below this number of submissions a process pool does not pay off
+
+@dataclass
+class Finding():
+    """Reason why a submission can not be graded successfully, found without executing it."""
+    code: str
+    detail: str
+
+    def __str__(self) -> str:
+        return f'{self.code}: {self.detail}'
+
+def _python_source(source: str) -> str:
+    # IPython syntax (magics, shell commands) is valid in a notebook
+    try:
+        from IPython.core.inputtransformer2 import TransformerManager
+        return TransformerManager().transform_cell(source)
+    except ImportError:
+        return '\n'.join(line for line in source.splitlines() if not line.lstrip().startswith(('%', '!')))
+
+def code_sources(notebook: nbformat.NotebookNode) -> list[str]:
+    """
+    Returns:
+        list[str]: the stripped source of each non-empty code cell of the notebook
+    """
+    sources = [cell.source.strip() for cell in notebook.cells if cell.cell_type == 'code']
+    return [source for source in sources if source != '']
+
+def _top_level(names: list[str], suffix: str) -> list[str]:
+    return [name for name in names if name.endswith(suffix) and '/' not in name and not name.startswith('__MACOSX')]
+
+class _Rejected(Exception):
+
+    def __init__(self, code: str, detail: str):
+        super().__init__(code, detail)
+        self.finding = Finding(code, detail)
+
+def _read_notebook(path: Path) -> tuple[str, bytes]:
+    """
+    Finds the notebook (or Python script) which otter would grade, i.e., the single top level notebook
+    of the otter zip file or of the student zip file inside of it.
+    """
+    with zipfile.ZipFile(path) as zf:
+        names = zf.namelist()
+        zips = _top_level(names, '.zip')
+        if len(zips) == 1:
+            with zf.open(zips[0]) as member, zipfile.ZipFile(member) as inner:
+                inner_names = inner.namelist()
+                for suffix in ['.ipynb', '.py']:
+                    found = _top_level(inner_names, suffix)
+                    if len(found) > 1:
+                        raise _Rejected(REASON_MULTIPLE_NOTEBOOKS, f'{", ".join(found)}')
+                    if len(found) == 1:
+                        return found[0], inner.read(found[0])
+        for suffix in ['.ipynb', '.py']:
+            found = _top_level(names, suffix)
+            if len(found) > 1:
+                raise _Rejected(REASON_MULTIPLE_NOTEBOOKS, f'{", ".join(found)}')
+            if len(found) == 1:
+                return found[0], zf.read(found[0])
+    raise _Rejected(REASON_NO_NOTEBOOK, 'the submission contains neither a notebook nor a Python script')
+
+def prescreen(path: Path, template: list[str]=None) -> Finding:
+    """
+    Checks a submission without executing it: the zip files have to be readable, it has to contain exactly one notebook (or Python script),
+    the notebook has to be valid, at least one of its code cells has to be valid Python and (if a template is given)
+    at least one of its code cells has to differ from the cells of the template.
+
+    Args:
+        path (Path): path to the (repackaged) submission zip file
+        template (list[str], optional): code sources of the student notebook handed out (see code_sources)
+
+    Returns:
+        Finding: the reason why the submission can not be graded, None if it is plausible
+    """
+    try:
+        name, content = _read_notebook(path)
+    except _Rejected as e:
+        return e.finding
+    except (OSError, zipfile.BadZipFile) as e:
+        return Finding(REASON_INVALID_ZIP, str(e))
+
+    if name.endswith('.py'):
+        sources = [content.decode('utf-8', errors='replace')]
+    else:
+        try:
+            notebook = nbformat.reads(content.decode('utf-8'), as_version=nbformat.NO_CONVERT)
+        except Exception as e:
+            return Finding(REASON_INVALID_NOTEBOOK, f'{name} can not be read: {str(e).splitlines()[0] if str(e) != "" else type(e).__name__}')
+        sources = code_sources(notebook)
+
+    if template != None:
+        template_sources = set(template)
+        sources = [source for source in sources if source not in template_sources]
+        if len(sources) == 0:
+            return Finding(REASON_EMPTY_TEMPLATE, f'{name} does not differ from the template')
+
+    errors = []
+    for source in sources:
+        try:
+            ast.parse(_python_source(source))
+        except SyntaxError as e:
+            errors.append(e)
+        except ValueError as e:
+            # e.g. null bytes
+            errors.append(SyntaxError(str(e)))
+    if len(sources) > 0 and len(errors) == len(sources):
+        return Finding(REASON_SYNTAX_ERRORS, f'every code cell of {name} has a syntax error, e.g. {errors[0].msg} (line {errors[0].lineno})')
+    return None
+
+def _prescreen(args: tuple) -> Finding:
+    return prescreen(*args)
+
+def prescreen_all(paths: list[Path], template: list[str]=None, jobs: int=None) -> list[Finding]:
+    """
+    Checks the submissions (see prescreen) by up to jobs processes.
+
+    Args:
+        paths (list[Path]): paths to the (repackaged) submission zip files
+        template (list[str], optional): code sources of the student notebook handed out
+        jobs (int, optional): number of processes, defaults to the number of usable cores
+
+    Returns:
+        list[Finding]: the finding of each submission in the order of paths, None if it is plausible
+    """
+    if jobs == None or jobs < 1:
+        jobs = cpu_count()
+    tasks = [(path, template) for path in paths]
+    if jobs == 1 or len(tasks) < MIN_PARALLEL:
+        return [_prescreen(task) for task in tasks]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(_prescreen, tasks, chunksize=max(1, len(tasks) // (4 * jobs))))
+
+def read_template(path: Path) -> list[str]:
+    """
+    Returns:
+        list[str]: the code sources of the student notebook at path (see code_sources), None if it can not be read
+    """
+    try:
+        return code_sources(nbformat.read(str(path), as_version=nbformat.NO_CONVERT))
+    except Exception as e:
+        LOGGER.warning(f'unable to read the template {path}: {e}')
+        return None
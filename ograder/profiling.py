@@ -0,0 +1,103 @@
+import cProfile
+import io
+import pstats
+import sys
+import threading
+
+from collections import Counter
+from pathlib import Path
+
+from otter.utils import loggers
+
+LOGGER = loggers.get_logger(__name__)
+
+SAMPLING_INTERVAL = 0.005 # seconds
+
+class StackSampler:
+
+    def __init__(self, interval: float=SAMPLING_INTERVAL):
+        """
+        Samples the call stack of the calling thread in a background thread and counts identical stacks.
+        The result can be written in the collapsed-stack format understood by flamegraph.pl, speedscope or inferno.
+
+        Args:
+            interval (float, optional): sampling interval in seconds
+        """
+        self.interval = interval
+        self.stacks = Counter()
+        self.__thread_id = None
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def __sample(self) -> None:
+        while not self.__stop.wait(self.interval):
+            frame = sys._current_frames().get(self.__thread_id)
+            stack = []
+            while frame != None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if len(stack) > 0:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self.__thread_id = threading.get_ident()
+        self.__thread = threading.Thread(target=self.__sample, daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__stop.set()
+        self.__thread.join()
+
+    def write(self, path: Path) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+class Profiler:
+
+    def __init__(self, prefix: Path, enabled=True):
+        """
+        Profiles the code executed inside the context by cProfile (deterministic) and by a StackSampler.
+        On exit it writes prefix.pstats (open it with pstats, snakeviz, ...) and prefix.collapsed (flamegraph input).
+
+        Args:
+            prefix (Path): path of the output files without suffix
+            enabled (bool, optional): if False, the profiler does nothing
+        """
+        self.prefix: Path = Path(prefix)
+        self.enabled = enabled
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler()
+
+    def __enter__(self):
+        if self.enabled:
+            self.sampler.start()
+            self.profile.enable()
+        return self
+
+    def __exit__(self, *args):
+        if self.enabled:
+            self.profile.disable()
+            self.sampler.stop()
+            self.prefix.parent.mkdir(parents=True, exist_ok=True)
+            self.profile.dump_stats(self.prefix.with_suffix('.pstats'))
+            self.sampler.write(self.prefix.with_suffix('.collapsed'))
+            LOGGER.info(f'written profile to {self.prefix.with_suffix(".pstats")} and {self.prefix.with_suffix(".collapsed")}')
+            stream = io.StringIO()
+            stats = pstats.Stats(self.profile, stream=stream)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(20)
+            LOGGER.info(stream.getvalue())
+
+def merge_stats(paths: list[Path], path: Path) -> None:
+    """
+    Merges multiple pstats files, e.g., of all grading workers, into one.
+    """
+    paths = [str(p) for p in paths]
+    if len(paths) == 0:
+        return
+    stats = pstats.Stats(paths[0])
+    for p in paths[1:]:
+        stats.add(p)
+    stats.dump_stats(path)
+    LOGGER.info(f'merged {len(paths)} worker profiles into {path}')
@@ -0,0 +1,208 @@
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable
+
+from otter.utils import loggers
+
+LOGGER = loggers.get_logger(__name__)
+
+REFRESH_INTERVAL = 1.0 # seconds between two updates of the live view
+WRITE_INTERVAL = 5.0 # seconds between two snapshots written to the progress file
+LOG_INTERVAL = 60.0 # seconds between two progress log lines if there is no terminal
+PROMETHEUS_SUFFIX = '.prom'
+METRIC_PREFIX = 'ograder'
+
+def _duration(seconds: float) -> str:
+    if seconds == None:
+        return '?'
+    seconds = int(round(seconds))
+    return f'{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}'
+
+def _label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def to_prometheus(snapshot: dict) -> str:
+    """
+    Formats a snapshot (see Progress.snapshot) in the Prometheus text format, e.g. for the textfile collector of the node exporter.
+
+    Args:
+        snapshot (dict): the progress of a grading run
+
+    Returns:
+        str: the metrics
+    """
+    lines = []
+    def metric(name: str, kind: str, description: str, samples: list[tuple[dict, float]]) -> None:
+        lines.append(f'# HELP {METRIC_PREFIX}_{name} {description}')
+        lines.append(f'# TYPE {METRIC_PREFIX}_{name} {kind}')
+        for labels, value in samples:
+            label = ','.join(f'{key}="{_label(text)}"' for key, text in labels.items())
+            lines.append(f'{METRIC_PREFIX}_{name}{{{label}}} {value}' if label != '' else f'{METRIC_PREFIX}_{name} {value}')
+
+    metric('submissions', 'gauge', 'Submissions of the grading run which have to be graded.', [({}, snapshot['total'])])
+    metric('submissions_finished', 'gauge', 'Finished submissions by status.', [({'status': status}, count) for status, count in sorted(snapshot['statuses'].items())])
+    metric('submissions_running', 'gauge', 'Submissions which are being graded.', [({}, snapshot['running'])])
+    metric('elapsed_seconds', 'gauge', 'Seconds since the grading started.', [({}, round(snapshot['elapsed_seconds'], 3))])
+    metric('submissions_per_second', 'gauge', 'Finished submissions per second.', [({}, round(snapshot['throughput'], 6))])
+    if snapshot['eta_seconds'] != None:
+        metric('eta_seconds', 'gauge', 'Estimated seconds until the grading is finished.', [({}, round(snapshot['eta_seconds'], 3))])
+    metric('worker_task_seconds', 'gauge', 'Seconds each worker has been grading its current submission, 0 if it is idle.',
+           [({'worker': worker['worker'], 'submission': worker['submission'] or ''}, round(worker['seconds'], 3)) for worker in snapshot['workers']])
+    return '\n'.join(lines) + '\n'
+
+class Progress:
+
+    def __init__(self, total: int, pool=None, label: Callable[[Any], str]=str, path: Path=None, live: bool=None):
+        """
+        Tracks the progress of a grading run, i.e., the number of finished submissions by status, the running submissions,
+        the throughput and the estimated remaining time. A background thread shows it as live view on stderr (if stderr is a terminal)
+        or as log line every LOG_INTERVAL seconds, and writes a snapshot to path every WRITE_INTERVAL seconds:
+        a JSON object per line or, if path ends with .prom, the Prometheus text format (the file is replaced atomically).
+
+        Args:
+            total (int): number of submissions which have to be graded
+            pool (WorkerPool | Coordinator, optional): the pool grading the submissions, its status() is shown per worker
+            label (Callable[[Any], str], optional): turns the key of a task into the name of its submission
+            path (Path, optional): progress file
+            live (bool, optional): show the live view, defaults to True if stderr is a terminal
+        """
+        self.total = total
+        self.pool = pool
+        self.label = label
+        self.path: Path = None if path == None else Path(path)
+        self.live = sys.stderr.isatty() if live == None else live
+        self.statuses = Counter()
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = None
+        if self.path != None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if self.path.suffix != PROMETHEUS_SUFFIX:
+                self.path.write_text('')
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def done(self) -> int:
+        return sum(self.statuses.values())
+
+    def update(self, statuses: list[str]) -> None:
+        """
+        Counts finished submissions.
+
+        Args:
+            statuses (list[str]): the grading status of each finished submission (see journal)
+        """
+        with self.lock:
+            self.statuses.update(statuses)
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: the current progress, i.e., the finished submissions by status, the running submissions, the throughput (submissions per second),
+                the estimated remaining seconds (None before the first submission is finished) and the task of each worker
+        """
+        elapsed = time.monotonic() - self.started
+        with self.lock:
+            statuses = dict(self.statuses)
+        done = sum(statuses.values())
+        workers = [] if self.pool == None else [{'worker': worker, 'submission': None if key == None else self.label(key), 'seconds': seconds} for worker, key, seconds in self.pool.status()]
+        throughput = done / elapsed if elapsed > 0 else 0.0
+        return {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'total': self.total,
+            'done': done,
+            'running': sum(1 for worker in workers if worker['submission'] != None),
+            'statuses': statuses,
+            'elapsed_seconds': elapsed,
+            'throughput': throughput,
+            'eta_seconds': (self.total - done) / throughput if throughput > 0 else None,
+            'workers': workers,
+        }
+
+    def format(self, snapshot: dict) -> list[str]:
+        """
+        Returns:
+            list[str]: a summary and one line for each worker
+        """
+        statuses = ', '.join(f'{count} {status}' for status, count in sorted(snapshot['statuses'].items()))
+        lines = [f'{snapshot["done"]}/{snapshot["total"]} done ({statuses or "none finished"}), {snapshot["running"]} running, '
+                 f'{snapshot["throughput"] * 60:.1f}/min, elapsed {_duration(snapshot["elapsed_seconds"])}, ETA {_duration(snapshot["eta_seconds"])}']
+        for worker in snapshot['workers']:
+            task = 'idle' if worker['submission'] == None else f'{worker["submission"]} ({worker["seconds"]:.0f}s)'
+            lines.append(f'  worker {worker["worker"]}: {task}')
+        return lines
+
+    def __render(self, snapshot: dict, final=False) -> None:
+        # a single line which is overwritten, such that log lines written in between are kept
+        lines = self.format(snapshot)
+        line = ' | '.join([lines[0]] + [worker.strip()[len('worker '):] for worker in lines[1:]])
+        line = line[:shutil.get_terminal_size().columns - 1]
+        sys.stderr.write(f'\r\x1b[K{line}' + ('\n' if final else ''))
+        sys.stderr.flush()
+
+    def write(self, snapshot: dict) -> None:
+        """
+        Writes the snapshot to the progress file.
+        """
+        if self.path == None:
+            return
+        try:
+            if self.path.suffix == PROMETHEUS_SUFFIX:
+                # the textfile collector must never read a partially written file
+                tmp_path = self.path.with_name(f'.{self.path.name}.{os.getpid()}')
+                tmp_path.write_text(to_prometheus(snapshot))
+                os.replace(tmp_path, self.path)
+            else:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(snapshot) + '\n')
+        except OSError as e:
+            LOGGER.warning(f'unable to write the progress to {self.path}: {e}')
+
+    def __loop(self) -> None:
+        last_write, last_log = time.monotonic(), time.monotonic()
+        while not self.__stop.wait(REFRESH_INTERVAL):
+            snapshot = self.snapshot()
+            now = time.monotonic()
+            if self.live:
+                self.__render(snapshot)
+            elif now - last_log >= LOG_INTERVAL:
+                LOGGER.info(self.format(snapshot)[0])
+                last_log = now
+            if now - last_write >= WRITE_INTERVAL:
+                self.write(snapshot)
+                last_write = now
+
+    def start(self) -> None:
+        self.started = time.monotonic()
+        self.__thread = threading.Thread(target=self.__loop, daemon=True)
+        self.__thread.start()
+
+    def close(self) -> None:
+        """
+        Stops the background thread and writes the final snapshot.
+        """
+        if self.__thread == None:
+            return
+        self.__stop.set()
+        self.__thread.join()
+        self.__thread = None
+        snapshot = self.snapshot()
+        self.write(snapshot)
+        if self.live:
+            self.__render(snapshot, final=True)
+        else:
+            LOGGER.info(self.format(snapshot)[0])
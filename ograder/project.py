@@ -1,16 +1,47 @@
 
+import time
+
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from .assign import Assignment
+from .local_grader import LocalGrader, GradingRun
+from .profiling import Profiler, merge_stats
 from .config import Config
+from .worker_pool import DEFAULT_MAX_TASKS_PER_WORKER
+from .kernel_pool import BACKEND_PROCESS
 from otter.utils import loggers
 
 LOGGER = loggers.get_logger(__name__)
 
 class Project:
     def __init__(self, config: Config):
+        """
+        The exercises and assignments of the config. An Assignment is only created when it is accessed,
+        i.e., a command which works on a single assignment (see get) does not pay for all the others.
+        """
         self.config = config
-        self.exercises : list[Assignment] = [Assignment(self.config, name=exercise['exercise'], assignment=False) for exercise in self.config.exercises]
-        self.assignments : list[Assignment] = [Assignment(self.config, name=exercise['exercise'], assignment=True) for exercise in self.config.assignments]
+        self.__created: dict[tuple[str, bool], Assignment] = {}
+    
+    def __assignment(self, name: str, assignment: bool) -> Assignment:
+        if (name, assignment) not in self.__created:
+            self.__created[(name, assignment)] = Assignment(self.config, name=name, assignment=assignment)
+        return self.__created[(name, assignment)]
+    
+    @property
+    def exercises(self) -> list[Assignment]:
+        return [self.__assignment(exercise['exercise'], False) for exercise in self.config.exercises]
+    
+    @property
+    def assignments(self) -> list[Assignment]:
+        return [self.__assignment(exercise['exercise'], True) for exercise in self.config.assignments]
+    
+    def get(self, name: str) -> Assignment:
+        """
+        Returns:
+            Assignment: the assignment called name or, if there is no assignment of this name, the exercise called name
+                (an exercise which is not part of the config uses the default configuration)
+        """
+        return self.__assignment(name, self.config.entry(name, assignment=True) != None)
 
     def exists(self):
         """
@@ -46,12 +77,45 @@ class Project:
         for assignment in self.assignments:
             assignment.add_empty_questions(n)
     
-    def grade_all(self, timeout=None, plot=False):
-        for exercise in self.exercises:
-            exercise.grade(timeout=timeout, plot=plot)
+    def grade_all(self, timeout=None, plot=False, jobs=None, max_tasks_per_worker=DEFAULT_MAX_TASKS_PER_WORKER, use_cache=True, parquet=False, profile=False, profile_workers=False, coordinator=None, authkey=None, dedup=True, memory_limit=None, cpu_limit=None, backend=BACKEND_PROCESS, prescreen=True, progress_file=None):
+        """
+        Grades the submissions of all exercises and assignments. The submissions of all assignments are graded by one shared pool of
+        up to jobs workers, longest-expected-first across the assignments, such that a small assignment does not leave workers idle
+        while a large one is still running. Each assignment gets its own grading directory and result file.
+        With a coordinator the assignments are graded one after the other since the remote workers grade against a single autograder.
+        """
+        if coordinator != None:
+            for assignment in self.all_assignments():
+                assignment.grade(timeout=timeout, plot=plot, jobs=jobs, max_tasks_per_worker=max_tasks_per_worker, use_cache=use_cache, parquet=parquet, profile=profile, profile_workers=profile_workers, coordinator=coordinator, authkey=authkey, dedup=dedup, memory_limit=memory_limit, cpu_limit=cpu_limit, backend=backend, prescreen=prescreen, progress_file=progress_file)
+            return
+        
+        prefix = self.config.root_dir / Path(self.config.semester) / Path('profiles') / Path(f'grade_{time.strftime("%Y%m%d_%H%M%S")}')
+        with Profiler(prefix, enabled=profile):
+            runs: list[GradingRun] = []
+            for assignment in self.all_assignments():
+                LOGGER.info(f'prepare grading of {assignment.name}')
+                run = assignment.prepare_grading(timeout=timeout, use_cache=use_cache, parquet=parquet, dedup=dedup, memory_limit=memory_limit, cpu_limit=cpu_limit, backend=backend, prescreen=prescreen)
+                if run != None:
+                    runs.append(run)
             
-        for assignment in self.assignments:
-            assignment.grade(timeout=timeout, plot=plot)
+            profile_dir = None
+            if profile_workers:
+                profile_dir = prefix.parent / Path(f'{prefix.name}_worker_profiles')
+                profile_dir.mkdir(parents=True, exist_ok=True)
+            
+            try:
+                LocalGrader.grade_runs(runs, LocalGrader.create_pool(jobs, max_tasks_per_worker, profile_dir), timeout, progress_file)
+            finally:
+                for run in runs:
+                    run.close()
+            
+            if profile_dir != None:
+                merge_stats(sorted(profile_dir.glob('task_*.pstats')), profile_dir.with_suffix('.pstats'))
+        
+        if plot:
+            for run in runs:
+                print(run.scores.to_dataframe(run.manual_questions))
+                run.scores.plot(bins=20)
     
     def upgrade_notebooks(self, n=0) -> None:
         for exercise in self.exercises:
@@ -60,12 +124,39 @@ class Project:
         for assignment in self.assignments:
             assignment.upgrade_notebook(n)
     
-    def generate_all(self, run_tests=True, seal_students_nb=True) -> None:
-        for exercise in self.exercises:
-            exercise.generate(run_tests=run_tests, seal_student_nb=seal_students_nb)
-            
-        for assignment in self.assignments:
-            assignment.generate(run_tests=run_tests, seal_student_nb=seal_students_nb)
+    def generate(self, assignments: list[Assignment], run_tests=True, seal_students_nb=True, jobs=1, force=True) -> list[tuple[Assignment, Exception]]:
+        """
+        Generates the student notebooks, solutions and autograder zip files of the assignments.
+        Up to jobs otter assign processes run concurrently, each one in its own temporary directory.
+        A failed generation does not stop the others. Unless force is set, assignments whose inputs did not change
+        since their last generation (see Assignment.build_inputs) are skipped.
+
+        Returns:
+            list[tuple[Assignment, Exception]]: the assignments whose generation failed and their error
+        """
+        failures, skipped = [], []
+        def generate(assignment: Assignment) -> None:
+            try:
+                if not assignment.generate(run_tests=run_tests, seal_student_nb=seal_students_nb, raise_error=True, force=force):
+                    skipped.append(assignment)
+            except Exception as error:
+                failures.append((assignment, error))
+        
+        if jobs == None or jobs <= 1 or len(assignments) <= 1:
+            for assignment in assignments:
+                generate(assignment)
+        else:
+            # otter assign runs in a subprocess, hence threads suffice
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                list(executor.map(generate, assignments))
+        
+        if len(skipped) > 0:
+            LOGGER.info(f'skipped {len(skipped)} of {len(assignments)} assignments which are up to date: {", ".join(str(assignment) for assignment in skipped)}')
+        order = {id(assignment): i for i, assignment in enumerate(assignments)}
+        return sorted(failures, key=lambda failure: order[id(failure[0])])
+    
+    def generate_all(self, run_tests=True, seal_students_nb=True, jobs=1, force=True) -> list[tuple[Assignment, Exception]]:
+        return self.generate(self.all_assignments(), run_tests=run_tests, seal_students_nb=seal_students_nb, jobs=jobs, force=force)
     
     def read_questions(self) -> None:
         for exercise in self.exercises:
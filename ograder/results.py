@@ -0,0 +1,143 @@
+import csv
+import re
+import zipfile
+
+from pathlib import Path
+
+import pandas as pd
+
+from otter.utils import loggers
+
+LOGGER = loggers.get_logger(__name__)
+
+OVERALL_POINTS_LABEL = 'overall'
+CARRIED_OVER_LABEL = 'carried_over'
+STUDENT_COLUMNS = ['name', 'forname', 'file']
+CSV_SEPARATOR = ';'
+
+def _natural_key(name: str) -> list:
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+def autograder_questions(autograder_zip: Path) -> list[str]:
+    """
+    Returns the names of the questions which are graded by the autograder, i.e., the names of its test files in natural order (q2 before q10).
+
+    Args:
+        autograder_zip (Path): path to the autograder zip file
+
+    Returns:
+        list[str]: question names
+    """
+    with zipfile.ZipFile(autograder_zip) as zf:
+        names = [Path(name).stem for name in zf.namelist() if name.startswith('tests/') and not name.endswith('/') and not Path(name).name.startswith('__')]
+    return sorted(set(names), key=_natural_key)
+
+class ResultWriter:
+
+    def __init__(self, path: Path, questions: list[str], manual_questions: list[str]=[], parquet=False, carried_over=False):
+        """
+        Writes the grading results row by row, i.e., one row for each student as soon as the student is graded.
+        The header is fixed by the autograded questions and the manual questions such that the (partial) result
+        can be read while the grading is still running. If questions is empty, the questions of the first written student are used.
+        Closing the writer sorts the rows by the students name and, if requested, writes a copy in the Parquet format.
+
+        Args:
+            path (Path): path to the result csv file, an existing file will be overwritten
+            questions (list[str]): names of the autograded questions
+            manual_questions (list[str], optional): names of the questions which are graded manually (empty cells)
+            parquet (bool, optional): if True, additionally write the result to a .parquet file next to path
+            carried_over (bool, optional): if True, a last column marks the students whose result has been taken from an earlier grading run
+        """
+        self.path: Path = Path(path)
+        self.questions = list(questions)
+        self.manual_questions = list(manual_questions)
+        self.parquet = parquet
+        self.carried_over = carried_over
+        self.rows = 0
+        self.file = open(self.path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file, delimiter=CSV_SEPARATOR)
+        if len(self.questions) > 0:
+            self.__write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def columns(self) -> list[str]:
+        return self.questions + self.manual_questions + [OVERALL_POINTS_LABEL] + STUDENT_COLUMNS + ([CARRIED_OVER_LABEL] if self.carried_over else [])
+
+    def __write_header(self) -> None:
+        self.writer.writerow(self.columns)
+        self.file.flush()
+
+    def write(self, student) -> None:
+        """
+        Appends the result of a graded student.
+
+        Args:
+            student (Student): successfully graded student
+        """
+        if self.rows == 0 and len(self.questions) == 0:
+            self.questions = list(student.questions)
+            self.__write_header()
+        unknown = [name for name in student.questions if name not in self.questions]
+        if len(unknown) > 0:
+            LOGGER.warning(f'ignoring the unknown questions {unknown} of {student}')
+        row = [student.questions[name].score if name in student.questions else '' for name in self.questions]
+        row += [''] * len(self.manual_questions)
+        row += [student.score_sum(), student.name, student.forname, str(student.file)]
+        if self.carried_over:
+            row.append(int(student.carried_over))
+        self.writer.writerow(row)
+        self.file.flush()
+        self.rows += 1
+
+    def read(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: the rows written so far
+        """
+        self.file.flush()
+        return pd.read_csv(self.path, sep=CSV_SEPARATOR, dtype={column: str for column in STUDENT_COLUMNS})
+
+    def close(self, scores=None) -> None:
+        """
+        Closes the writer and rewrites the result sorted by the students name.
+
+        Args:
+            scores (ScoreMatrix, optional): the scores of all graded students, if given, the final result is written from it instead of reading back the written rows
+        """
+        if self.file.closed:
+            return
+        if self.rows == 0 and len(self.questions) == 0:
+            self.__write_header()
+        self.file.close()
+        if scores != None:
+            data = scores.sorted().to_dataframe(self.manual_questions)
+        else:
+            data = pd.read_csv(self.path, sep=CSV_SEPARATOR, dtype={column: str for column in STUDENT_COLUMNS})
+            data = data.sort_values('name', kind='stable')
+        data.to_csv(self.path, sep=CSV_SEPARATOR, index=False)
+        if self.parquet:
+            try:
+                data.to_parquet(self.path.with_suffix('.parquet'), index=False)
+            except ImportError as e:
+                LOGGER.error(f'could not write {self.path.with_suffix(".parquet")}: {e}')
+
+def read_result(path: Path, questions: list[str]) -> dict[str, dict[str, float]]:
+    """
+    Reads a result csv file written by ResultWriter.
+
+    Args:
+        path (Path): path to the result csv file
+        questions (list[str]): names of the autograded questions, other columns are ignored
+
+    Returns:
+        dict[str, dict[str, float]]: maps the student zip file name to the scores of the questions
+    """
+    data = pd.read_csv(path, sep=CSV_SEPARATOR, dtype={column: str for column in STUDENT_COLUMNS})
+    columns = [question for question in questions if question in data.columns]
+    return {row['file']: {question: float(row[question]) for question in columns if not pd.isna(row[question])} for _, row in data.iterrows()}
@@ -0,0 +1,351 @@
+import hashlib
+import json
+import os
+import re
+import resource
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+
+from contextlib import redirect_stdout, nullcontext
+from datetime import datetime
+
+import dill
+
+from otter.run.run_autograder import main as run_autograder_main
+from otter.utils import loggers
+
+from .kernel_pool import KernelPool, executing_by
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+LOGGER = loggers.get_logger(__name__)
+
+# cells added by otter to run the tests of the notebook
+TEST_CELL_PATTERN = re.compile(r'\.check(_all)?\(|otter\.execute import Checker')
+
+PHASE_UNPACK = 'unpack'
+PHASE_EXECUTE = 'execute'
+PHASE_TESTS = 'tests'
+
+LIMIT_MEMORY = 'memory'
+LIMIT_CPU = 'cpu'
+
+STAGING_DIR = os.path.join(tempfile.gettempdir(), 'ograder_autograders')
+STAGED_MANIFEST = 'manifest.json'
+
+class LimitExceeded(Exception):
+    """Raised if the grading of a submission exceeded a resource limit, its kernel has been killed."""
+
+    def __init__(self, message: str, peak_rss: int=None):
+        super().__init__(message, peak_rss)
+        self.peak_rss = peak_rss
+
+    def __str__(self) -> str:
+        return self.args[0]
+
+class MemoryLimitExceeded(LimitExceeded):
+    pass
+
+class CpuLimitExceeded(LimitExceeded):
+    pass
+
+def limits_supported() -> bool:
+    """
+    Returns:
+        bool: True if memory and CPU limits can be enforced, i.e., if psutil is installed
+    """
+    return psutil != None
+
+class PeakMemory:
+
+    def __init__(self, interval: float=0.05, memory_limit: int=None, cpu_limit: float=None, exclude=None):
+        """
+        Samples the resident set size (RSS) of this process and all its children (e.g. the kernel executing the notebook)
+        in a background thread and remembers the peak. Without psutil the peak RSS of the largest terminated child is used,
+        which is an upper bound since it covers every child this process ever waited for.
+        If the children exceed the memory limit (RSS) or the CPU limit (user and system time), they are killed and exceeded is set
+        to LIMIT_MEMORY or LIMIT_CPU. Limits require psutil.
+
+        Args:
+            interval (float, optional): sampling interval in seconds
+            memory_limit (int, optional): maximum RSS of all children in bytes
+            cpu_limit (float, optional): maximum CPU time of all children in seconds
+            exclude (Callable[[], set[int]], optional): returns the process ids of children which are not measured, e.g. idle kernels of a KernelPool
+        """
+        self.interval = interval
+        self.exclude = exclude
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.peak = 0
+        self.exceeded = None
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def __sample(self) -> None:
+        process = psutil.Process()
+        while not self.__stop.is_set():
+            children = process.children(recursive=True)
+            if self.exclude != None:
+                excluded = self.exclude()
+                children = [p for p in children if p.pid not in excluded]
+            rss, children_rss, cpu = 0, 0, 0.0
+            for p in [process] + children:
+                try:
+                    p_rss = p.memory_info().rss
+                    rss += p_rss
+                    if p != process:
+                        children_rss += p_rss
+                        times = p.cpu_times()
+                        cpu += times.user + times.system
+                except psutil.Error:
+                    pass
+            self.peak = max(self.peak, rss)
+            if self.memory_limit != None and children_rss > self.memory_limit:
+                self.exceeded = LIMIT_MEMORY
+            elif self.cpu_limit != None and cpu > self.cpu_limit:
+                self.exceeded = LIMIT_CPU
+            if self.exceeded != None:
+                for p in children:
+                    try:
+                        p.kill()
+                    except psutil.Error:
+                        pass
+                break
+            self.__stop.wait(self.interval)
+
+    def __enter__(self):
+        if psutil != None:
+            self.__thread = threading.Thread(target=self.__sample, daemon=True)
+            self.__thread.start()
+        return self
+
+    def __exit__(self, *args):
+        if self.__thread != None:
+            self.__stop.set()
+            self.__thread.join()
+        else:
+            # ru_maxrss is in kilobytes on Linux
+            self.peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+
+def test_seconds(notebook) -> float:
+    """
+    Sums up the execution time of the cells which otter added to the notebook to run the tests.
+
+    Args:
+        notebook (nbformat.NotebookNode): the notebook executed by otter (with cell timing metadata)
+
+    Returns:
+        float: time spent running tests in seconds
+    """
+    seconds = 0.0
+    for cell in notebook.cells:
+        execution = cell.get('metadata', {}).get('execution', {})
+        if cell.cell_type != 'code' or not TEST_CELL_PATTERN.search(cell.source):
+            continue
+        if 'iopub.execute_input' in execution and 'shell.execute_reply' in execution:
+            start = datetime.fromisoformat(execution['iopub.execute_input'].replace('Z', '+00:00'))
+            end = datetime.fromisoformat(execution['shell.execute_reply'].replace('Z', '+00:00'))
+            seconds += (end - start).total_seconds()
+    return seconds
+
+def _staged_path(ag_path: str, staging_dir: str) -> str:
+    # the autograder zip is identified by its path, size and modification time, i.e., a regenerated zip is staged again
+    stat = os.stat(ag_path)
+    key = hashlib.sha256(f'{os.path.abspath(ag_path)}\0{stat.st_size}\0{stat.st_mtime_ns}'.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(staging_dir, f'{os.path.splitext(os.path.basename(ag_path))[0]}_{key}')
+
+def _staged_intact(staged: str) -> bool:
+    try:
+        with open(os.path.join(staged, STAGED_MANIFEST), 'r') as f:
+            manifest = json.load(f)
+        for path, (size, mtime_ns) in manifest.items():
+            stat = os.stat(os.path.join(staged, path))
+            if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+                return False
+    except (OSError, ValueError):
+        return False
+    return True
+
+def remove_staged(ag_path: str, staging_dir: str=STAGING_DIR) -> None:
+    """
+    Removes the staged autograder of ag_path (if there is one).
+    """
+    if os.path.exists(ag_path):
+        shutil.rmtree(_staged_path(ag_path, staging_dir), ignore_errors=True)
+
+def stage_autograder(ag_path: str, staging_dir: str=STAGING_DIR) -> str:
+    """
+    Extracts and validates an autograder zip once, every submission is graded against the staged tree instead of unpacking the zip again.
+    The staged tree consists of source (everything otter reads from the autograder except the support files) and files (the support files,
+    e.g. data sets, which are hard linked into the submission directory). Its files are read-only, if one of the support files has been
+    modified nonetheless (e.g. by a notebook running as root), the autograder is staged again.
+    Concurrent workers stage into a temporary directory which is renamed, therefore they never see a partially staged tree.
+
+    Args:
+        ag_path (str): path to the autograder zip file
+        staging_dir (str, optional): directory containing the staged autograders
+
+    Raises:
+        ValueError: if the zip file is not an otter autograder, i.e., otter_config.json or tests are missing
+
+    Returns:
+        str: path to the staged autograder
+    """
+    staged = _staged_path(ag_path, staging_dir)
+    if os.path.exists(staged):
+        if _staged_intact(staged):
+            return staged
+        LOGGER.warning(f'the staged autograder {staged} has been modified, staging it again')
+        shutil.rmtree(staged, ignore_errors=True)
+
+    os.makedirs(staging_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=staging_dir)
+    try:
+        source_dir = os.path.join(tmp_dir, 'source')
+        with zipfile.ZipFile(ag_path) as ag_zip:
+            ag_zip.extractall(source_dir)
+        try:
+            with open(os.path.join(source_dir, 'otter_config.json'), 'r') as f:
+                json.load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError(f'{ag_path} is not an otter autograder, its otter_config.json is missing or invalid: {e}')
+        if not os.path.isdir(os.path.join(source_dir, 'tests')):
+            raise ValueError(f'{ag_path} is not an otter autograder, it does not contain tests')
+        if os.path.isdir(os.path.join(source_dir, 'files')):
+            os.rename(os.path.join(source_dir, 'files'), os.path.join(tmp_dir, 'files'))
+
+        manifest = {}
+        for root, _, files in os.walk(tmp_dir):
+            for file in files:
+                path = os.path.join(root, file)
+                os.chmod(path, 0o444)
+                if os.path.relpath(path, tmp_dir).startswith('files' + os.sep):
+                    stat = os.stat(path)
+                    manifest[os.path.relpath(path, tmp_dir)] = [stat.st_size, stat.st_mtime_ns]
+        with open(os.path.join(tmp_dir, STAGED_MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+        try:
+            os.rename(tmp_dir, staged)
+        except OSError:
+            # another worker staged the autograder in the meantime
+            if not os.path.exists(staged):
+                raise
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return staged
+
+def _link(src: str, dst: str) -> None:
+    if os.path.lexists(dst) and not os.path.isdir(dst):
+        os.unlink(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        # e.g. the staging and the temporary directory are on different file systems
+        shutil.copy(src, dst)
+
+def _link_tree(src: str, dst: str) -> None:
+    os.makedirs(dst, exist_ok=True)
+    for entry in os.scandir(src):
+        if entry.is_dir():
+            _link_tree(entry.path, os.path.join(dst, entry.name))
+        else:
+            _link(entry.path, os.path.join(dst, entry.name))
+
+def grade_submission(submission_path: str, ag_path: str, quiet: bool=False, debug: bool=False, memory_limit: int=None, cpu_limit: float=None, kernels: KernelPool=None):
+    """
+    Grades a single submission without containerization, like otter.api.grade_submission, but measures the time spent in each phase:
+    unpacking the autograder and the submission, executing the notebook and running the tests.
+    It also measures the peak memory used by the grading (including the kernel) and enforces the resource limits of the kernel.
+    The autograder is staged once (see stage_autograder), its support files are hard linked into the submission directory.
+
+    Args:
+        submission_path (str): path to the submission zip file
+        ag_path (str): path to the autograder zip file
+        quiet (bool): whether to suppress the output of the grading
+        debug (bool): whether to run otter in debug mode
+        memory_limit (int, optional): maximum RSS of the kernel in bytes
+        cpu_limit (float, optional): maximum CPU time of the kernel in seconds
+        kernels (KernelPool, optional): if given, the notebook is executed by a pre-started kernel of this pool instead of a kernel started by otter
+
+    Raises:
+        MemoryLimitExceeded: if the kernel exceeded the memory limit
+        CpuLimitExceeded: if the kernel exceeded the CPU limit
+
+    Returns:
+        tuple[otter.test_files.GradingResults, dict[str, float], int]: the results, the phase durations in seconds and the peak RSS in bytes
+    """
+    timings = {}
+    memory = PeakMemory(memory_limit=memory_limit, cpu_limit=cpu_limit, exclude=None if kernels == None else kernels.spare_pids)
+    try:
+        results, run_seconds = _run(submission_path, ag_path, quiet, debug, memory, timings, kernels)
+    except Exception as e:
+        if memory.exceeded == None:
+            raise
+        _raise_exceeded(memory, e)
+    if memory.exceeded != None:
+        _raise_exceeded(memory)
+
+    notebook = getattr(results, 'notebook', None)
+    timings[PHASE_TESTS] = test_seconds(notebook) if notebook != None else float('nan')
+    timings[PHASE_EXECUTE] = run_seconds - (timings[PHASE_TESTS] if notebook != None else 0.0)
+    return results, timings, memory.peak
+
+def _raise_exceeded(memory: PeakMemory, cause: Exception=None):
+    if memory.exceeded == LIMIT_MEMORY:
+        raise MemoryLimitExceeded(f'the kernel exceeded the memory limit of {memory.memory_limit / (1024 * 1024):.0f} MB', memory.peak) from cause
+    raise CpuLimitExceeded(f'the kernel exceeded the CPU time limit of {memory.cpu_limit} seconds', memory.peak) from cause
+
+def _run(submission_path: str, ag_path: str, quiet: bool, debug: bool, memory: PeakMemory, timings: dict, kernels: KernelPool=None) -> tuple:
+    with memory:
+        start = time.perf_counter()
+        dp = tempfile.mkdtemp()
+        try:
+            staged = stage_autograder(ag_path)
+            ag_dir = os.path.join(dp, 'autograder')
+            for subdir in ['submission', 'results']:
+                os.makedirs(os.path.join(ag_dir, subdir), exist_ok=True)
+            with open(os.path.join(ag_dir, 'submission_metadata.json'), 'w+') as f:
+                json.dump({}, f)
+            # otter only reads the source directory
+            try:
+                os.symlink(os.path.join(staged, 'source'), os.path.join(ag_dir, 'source'), target_is_directory=True)
+            except OSError:
+                _link_tree(os.path.join(staged, 'source'), os.path.join(ag_dir, 'source'))
+            if os.path.splitext(submission_path)[1] == '.zip':
+                with zipfile.ZipFile(submission_path) as submission_zip:
+                    submission_zip.extractall(os.path.join(ag_dir, 'submission'))
+            else:
+                shutil.copy(submission_path, os.path.join(ag_dir, 'submission'))
+            # like otter, support files replace files of the submission, but directories of the submission are kept
+            files_dir = os.path.join(staged, 'files')
+            if os.path.isdir(files_dir):
+                for entry in os.scandir(files_dir):
+                    dst = os.path.join(ag_dir, 'submission', entry.name)
+                    if not entry.is_dir():
+                        _link(entry.path, dst)
+                    elif not os.path.exists(dst):
+                        _link_tree(entry.path, dst)
+            timings[PHASE_UNPACK] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with open(os.devnull, 'w') if quiet else nullcontext() as devnull:
+                with redirect_stdout(devnull) if quiet else nullcontext():
+                    if kernels != None:
+                        with kernels.lease(os.path.join(ag_dir, 'submission')) as km, executing_by(km, kernels.kernel_name):
+                            run_autograder_main(ag_dir, logo=False, debug=debug, otter_run=True)
+                    else:
+                        run_autograder_main(ag_dir, logo=False, debug=debug, otter_run=True)
+            run_seconds = time.perf_counter() - start
+
+            with open(os.path.join(ag_dir, 'results', 'results.pkl'), 'rb') as f:
+                results = dill.load(f)
+        finally:
+            shutil.rmtree(dp)
+    return results, run_seconds
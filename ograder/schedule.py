@@ -0,0 +1,149 @@
+import json
+import os
+import zipfile
+
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from otter.utils import loggers
+
+LOGGER = loggers.get_logger(__name__)
+
+HISTORY_FILE = 'grading_history.json'
+HISTORY_WEIGHT = 0.5 # weight of the latest measurement in the moving average of the grading time
+SLOW_FRACTION = 0.8 # submissions expected to take longer than this fraction of the timeout are put into the timeout lane
+DEFAULT_SECONDS_PER_CELL = 0.1 # used if there is not enough history to fit the grading time
+MIN_FIT_SAMPLES = 3
+
+@dataclass
+class Features():
+    """Cheap features of a submission which are available before it is graded."""
+    notebook_bytes: int = 0
+    code_cells: int = 0
+
+def _notebook_features(zf: zipfile.ZipFile, features: Features) -> None:
+    for info in zf.infolist():
+        if info.filename.endswith('.zip'):
+            with zf.open(info) as member, zipfile.ZipFile(member) as inner:
+                _notebook_features(inner, features)
+        elif info.filename.endswith('.ipynb') and not info.filename.startswith('__MACOSX'):
+            features.notebook_bytes += info.file_size
+            try:
+                notebook = json.loads(zf.read(info))
+                features.code_cells += sum(1 for cell in notebook.get('cells', []) if cell.get('cell_type') == 'code')
+            except ValueError:
+                pass
+
+def submission_features(path: Path) -> Features:
+    """
+    Computes the size and the number of code cells of the notebooks contained in an otter zip file (including zip files inside of it).
+
+    Args:
+        path (Path): path to the (repackaged) submission zip file
+
+    Returns:
+        Features: the features, zero if the file can not be read
+    """
+    features = Features()
+    try:
+        with zipfile.ZipFile(path) as zf:
+            _notebook_features(zf, features)
+    except (OSError, zipfile.BadZipFile):
+        pass
+    return features
+
+class GradingHistory:
+
+    def __init__(self, path: Path):
+        """
+        Grading times of the students of an assignment measured by earlier grading runs.
+        Each student (identified by its zip file name) maps to the moving average of its grading time in seconds,
+        whether its last grading timed out and the number of runs.
+
+        Args:
+            path (Path): path to the history file (usually grading_history.json in the submission directory)
+        """
+        self.path: Path = Path(path)
+        self.entries: dict[str, dict] = {}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                LOGGER.warning(f'ignoring the unreadable grading history {self.path}')
+
+    def __contains__(self, file: str) -> bool:
+        return file in self.entries
+
+    def seconds(self, file: str) -> float:
+        return self.entries[file]['seconds']
+
+    def timed_out(self, file: str) -> bool:
+        return self.entries.get(file, {}).get('timed_out', False)
+
+    def update(self, file: str, seconds: float, timed_out=False) -> None:
+        """
+        Records a grading time, for a timed out grading seconds is a lower bound.
+        """
+        entry = self.entries.get(file)
+        if entry == None:
+            self.entries[file] = {'seconds': seconds, 'timed_out': timed_out, 'runs': 1}
+        else:
+            entry['seconds'] = max(seconds, entry['seconds']) if timed_out else HISTORY_WEIGHT * seconds + (1 - HISTORY_WEIGHT) * entry['seconds']
+            entry['timed_out'] = timed_out
+            entry['runs'] += 1
+
+    def save(self) -> None:
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+def estimate_seconds(files: list[str], features: list[Features], history: GradingHistory) -> np.ndarray:
+    """
+    Estimates the grading time of each submission. Submissions graded before are estimated by their history,
+    the others by a least squares fit of the grading time to the notebook size and the number of code cells of the submissions with history.
+
+    Args:
+        files (list[str]): zip file names of the submissions
+        features (list[Features]): features of the submissions
+        history (GradingHistory): grading times of earlier runs
+
+    Returns:
+        np.ndarray: expected grading time in seconds of each submission
+    """
+    X = np.array([[1.0, f.code_cells, f.notebook_bytes / 1024] for f in features]).reshape(-1, 3)
+    known = np.array([file in history and not history.timed_out(file) for file in files], dtype=bool)
+    if known.sum() >= MIN_FIT_SAMPLES:
+        y = np.array([history.seconds(file) for file, k in zip(files, known) if k])
+        coefficients, *_ = np.linalg.lstsq(X[known], y, rcond=None)
+        estimates = np.maximum(X @ coefficients, 0.0)
+    else:
+        estimates = X[:, 1] * DEFAULT_SECONDS_PER_CELL
+    for i, file in enumerate(files):
+        if file in history:
+            estimates[i] = history.seconds(file)
+    return estimates
+
+def schedule(files: list[str], features: list[Features], history: GradingHistory, timeout: float=None) -> tuple[list[int], set[int], np.ndarray]:
+    """
+    Orders the submissions longest-expected-first, such that long running submissions do not stretch the end of a parallel grading,
+    and flags the submissions which are likely to hit the timeout, i.e., which timed out before or are expected to take longer than SLOW_FRACTION of the timeout.
+
+    Args:
+        files (list[str]): zip file names of the submissions
+        features (list[Features]): features of the submissions
+        history (GradingHistory): grading times of earlier runs
+        timeout (float, optional): grading timeout in seconds, without timeout no submission is flagged
+
+    Returns:
+        tuple[list[int], set[int], np.ndarray]: the indices of the submissions in grading order, the indices of the flagged submissions and the expected grading times
+    """
+    estimates = estimate_seconds(files, features, history)
+    order = sorted(range(len(files)), key=lambda i: -estimates[i])
+    slow = set()
+    if timeout != None:
+        slow = {i for i, file in enumerate(files) if history.timed_out(file) or estimates[i] >= SLOW_FRACTION * timeout}
+    return order, slow, estimates
@@ -0,0 +1,183 @@
+import sqlite3
+
+from pathlib import Path
+
+import pandas as pd
+
+from otter.utils import loggers
+
+from .defaults import RESULTS_FILE, GROUP_BY
+
+LOGGER = loggers.get_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    semester TEXT NOT NULL,
+    assignment TEXT NOT NULL,
+    grading_dir TEXT NOT NULL UNIQUE,
+    time TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS students (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    forname TEXT NOT NULL,
+    UNIQUE (name, forname)
+);
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    semester TEXT NOT NULL,
+    assignment TEXT NOT NULL,
+    name TEXT NOT NULL,
+    possible REAL,
+    UNIQUE (semester, assignment, name)
+);
+CREATE TABLE IF NOT EXISTS scores (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    student_id INTEGER NOT NULL REFERENCES students(id),
+    question_id INTEGER NOT NULL REFERENCES questions(id),
+    score REAL,
+    PRIMARY KEY (run_id, student_id, question_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS runs_assignment ON runs (semester, assignment, time);
+CREATE INDEX IF NOT EXISTS students_name ON students (name);
+CREATE INDEX IF NOT EXISTS scores_student ON scores (student_id);
+CREATE INDEX IF NOT EXISTS scores_question ON scores (question_id, run_id, score);
+CREATE VIEW IF NOT EXISTS latest_runs AS
+    SELECT run.* FROM runs AS run WHERE run.time = (SELECT MAX(latest.time) FROM runs AS latest WHERE latest.semester = run.semester AND latest.assignment = run.assignment);
+CREATE VIEW IF NOT EXISTS latest_scores AS
+    SELECT runs.semester, runs.assignment, runs.time, students.name, students.forname, questions.name AS question, scores.score, questions.possible
+    FROM scores
+    JOIN runs ON runs.id = scores.run_id
+    JOIN students ON students.id = scores.student_id
+    JOIN questions ON questions.id = scores.question_id
+    WHERE runs.id IN (SELECT id FROM latest_runs);
+"""
+
+class ResultStore:
+
+    def __init__(self, path: Path):
+        """
+        Project-level SQLite database of the grading results of all assignments and semesters.
+        Each grading run is stored once (a resumed run replaces its earlier rows), queries consider the latest run of each assignment
+        (see the view latest_scores) unless all runs are requested.
+
+        Args:
+            path (Path): path to the database file, it is created if it does not exist
+        """
+        self.path: Path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __id(self, table: str, columns: dict, updates: dict={}) -> int:
+        where = ' AND '.join(f'{column} = ?' for column in columns)
+        row = self.connection.execute(f'SELECT id FROM {table} WHERE {where}', tuple(columns.values())).fetchone()
+        if row != None:
+            if len(updates) > 0:
+                self.connection.execute(f'UPDATE {table} SET {", ".join(f"{column} = ?" for column in updates)} WHERE id = ?', (*updates.values(), row[0]))
+            return row[0]
+        values = {**columns, **updates}
+        return self.connection.execute(f'INSERT INTO {table} ({", ".join(values)}) VALUES ({", ".join("?" * len(values))})', tuple(values.values())).lastrowid
+
+    def add_run(self, semester: str, assignment: str, grading_dir: Path, time_str: str, students: list, questions: list[str]) -> None:
+        """
+        Stores the result of a grading run in one transaction, an earlier result of the same grading directory is replaced.
+
+        Args:
+            semester (str): semester of the assignment
+            assignment (str): name of the assignment
+            grading_dir (Path): grading directory of the run
+            time_str (str): timestamp of the run (grading_<time_str>)
+            students (list[Student]): the successfully graded students
+            questions (list[str]): names of the autograded questions
+        """
+        with self.connection:
+            self.connection.execute('DELETE FROM runs WHERE grading_dir = ?', (str(grading_dir),))
+            run_id = self.connection.execute('INSERT INTO runs (semester, assignment, grading_dir, time) VALUES (?, ?, ?, ?)',
+                                             (semester, assignment, str(grading_dir), time_str)).lastrowid
+            question_ids = {}
+            for question in questions:
+                possible = next((student.questions[question].possible for student in students if question in student.questions), None)
+                question_ids[question] = self.__id('questions', {'semester': semester, 'assignment': assignment, 'name': question},
+                                                   {} if possible == None or possible != possible else {'possible': possible})
+            rows = []
+            for student in students:
+                student_id = self.__id('students', {'name': student.name, 'forname': student.forname})
+                rows += [(run_id, student_id, question_ids[name], question.score) for name, question in student.questions.items() if name in question_ids]
+            self.connection.executemany('INSERT INTO scores (run_id, student_id, question_id, score) VALUES (?, ?, ?, ?)', rows)
+        LOGGER.info(f'stored {len(rows)} scores of {len(students)} students of {assignment} in {self.path}')
+
+    def query(self, semester: str=None, assignments: list[str]=[], student: str=None, question: str=None, group_by: str=None, all_runs=False) -> pd.DataFrame:
+        """
+        Queries the stored scores.
+
+        Args:
+            semester (str, optional): only this semester
+            assignments (list[str], optional): only these assignments
+            student (str, optional): only students whose name or forname contains this text (case insensitive)
+            question (str, optional): only this question
+            group_by (str, optional): None (one row per score), student (sum of the scores of each student and assignment),
+                assignment (mean overall score of each assignment) or question (mean score of each question)
+            all_runs (bool, optional): consider all runs instead of the latest run of each assignment
+
+        Returns:
+            pd.DataFrame: the result
+        """
+        # the scores are selected and aggregated by the integer ids, the names are joined to the (small) result
+        run_conditions, params = ([] if all_runs else ['id IN (SELECT id FROM latest_runs)']), []
+        if semester != None:
+            run_conditions.append('semester = ?')
+            params.append(semester)
+        if len(assignments) > 0:
+            run_conditions.append(f'assignment IN ({", ".join("?" * len(assignments))})')
+            params += list(assignments)
+        conditions = [f'run_id IN (SELECT id FROM runs{"" if len(run_conditions) == 0 else " WHERE " + " AND ".join(run_conditions)})']
+        if student != None:
+            conditions.append('student_id IN (SELECT id FROM students WHERE name LIKE ? OR forname LIKE ?)')
+            params += [f'%{student}%'] * 2
+        if question != None:
+            conditions.append('question_id IN (SELECT id FROM questions WHERE name = ?)')
+            params.append(question)
+        selected = f'SELECT * FROM scores WHERE {" AND ".join(conditions)}'
+
+        if group_by == None:
+            sql = f'''SELECT runs.semester, runs.assignment, runs.time, students.name, students.forname, questions.name AS question, selected.score, questions.possible
+                      FROM ({selected}) AS selected JOIN runs ON runs.id = selected.run_id JOIN students ON students.id = selected.student_id JOIN questions ON questions.id = selected.question_id
+                      ORDER BY runs.semester, runs.assignment, runs.time, students.name, students.forname, questions.name'''
+        elif group_by == 'student':
+            sql = f'''SELECT runs.semester, runs.assignment, runs.time, students.name, students.forname, totals.score, totals.possible
+                      FROM (SELECT run_id, student_id, SUM(score) AS score, SUM(possible) AS possible FROM ({selected}) AS selected JOIN questions ON questions.id = selected.question_id GROUP BY run_id, student_id) AS totals
+                      JOIN runs ON runs.id = totals.run_id JOIN students ON students.id = totals.student_id
+                      ORDER BY students.name, students.forname, runs.semester, runs.assignment, runs.time'''
+        elif group_by == 'assignment':
+            sql = f'''SELECT runs.semester, runs.assignment, runs.time, totals.students, totals.mean, totals.min, totals.max
+                      FROM (SELECT run_id, COUNT(*) AS students, AVG(score) AS mean, MIN(score) AS min, MAX(score) AS max
+                            FROM (SELECT run_id, SUM(score) AS score FROM ({selected}) GROUP BY run_id, student_id) GROUP BY run_id) AS totals
+                      JOIN runs ON runs.id = totals.run_id
+                      ORDER BY runs.semester, runs.assignment, runs.time'''
+        elif group_by == 'question':
+            sql = f'''SELECT questions.semester, questions.assignment, questions.name AS question, totals.students, totals.mean, questions.possible
+                      FROM (SELECT question_id, COUNT(*) AS students, AVG(score) AS mean FROM ({selected}) GROUP BY question_id) AS totals
+                      JOIN questions ON questions.id = totals.question_id
+                      ORDER BY totals.mean, questions.semester, questions.assignment, questions.name'''
+        else:
+            raise ValueError(f'unknown group_by {group_by}, expected one of {GROUP_BY}')
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    def sql(self, sql: str) -> pd.DataFrame:
+        """
+        Executes an arbitrary (read) query, the tables are runs, students, questions, scores and the views latest_runs and latest_scores.
+        """
+        return pd.read_sql_query(sql, self.connection)
@@ -0,0 +1,90 @@
+import csv
+import json
+import math
+
+from pathlib import Path
+
+import numpy as np
+
+from otter.utils import loggers
+
+LOGGER = loggers.get_logger(__name__)
+
+CSV_SEPARATOR = ';'
+TIMING_COLUMNS = ['unpack', 'execute', 'tests', 'transfer', 'total']
+MEMORY_COLUMN = 'peak_rss_mb'
+PERCENTILES = {'p50': 50, 'p95': 95, 'max': 100}
+
+class TimingWriter:
+
+    def __init__(self, path: Path, summary_path: Path=None):
+        """
+        Writes the time measurements of each graded submission row by row, i.e., the wall time of the phases
+        unpack, execute (notebook execution including the kernel startup), tests, transfer (of the result back to the grader) and total,
+        the peak memory and whether the grading timed out. Closing the writer computes a summary (p50, p95 and max of each column).
+
+        Args:
+            path (Path): path to the timing csv file
+            summary_path (Path, optional): path to the json file to which the summary is written
+        """
+        self.path: Path = Path(path)
+        self.summary_path: Path = summary_path
+        self.values: dict[str, list[float]] = {column: [] for column in TIMING_COLUMNS + [MEMORY_COLUMN]}
+        self.timeouts = 0
+        self.file = open(self.path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file, delimiter=CSV_SEPARATOR)
+        self.writer.writerow(['name', 'forname', 'file', 'status'] + TIMING_COLUMNS + [MEMORY_COLUMN, 'timed_out'])
+        self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, student, status: str, timings: dict[str, float], peak_rss: int=None, timed_out=False) -> None:
+        """
+        Appends the measurements of a student.
+
+        Args:
+            student (Student): the student
+            status (str): grading status, e.g. graded, failed or timeout
+            timings (dict[str, float]): seconds spent in each phase, missing phases are left empty
+            peak_rss (int, optional): peak resident set size in bytes
+            timed_out (bool, optional): whether the grading timed out
+        """
+        row = [student.name, student.forname, str(student.file), status]
+        for column in TIMING_COLUMNS:
+            value = timings.get(column, float('nan'))
+            row.append('' if math.isnan(value) else round(value, 4))
+            self.values[column].append(value)
+        peak_rss_mb = float('nan') if peak_rss == None else peak_rss / (1024 * 1024)
+        row.append('' if math.isnan(peak_rss_mb) else round(peak_rss_mb, 1))
+        self.values[MEMORY_COLUMN].append(peak_rss_mb)
+        row.append(timed_out)
+        self.timeouts += int(timed_out)
+        self.writer.writerow(row)
+        self.file.flush()
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict: for each column the percentiles (p50, p95, max) of all measured values, plus the number of submissions and timeouts
+        """
+        summary = {'submissions': len(self.values['total']), 'timeouts': self.timeouts}
+        for column, values in self.values.items():
+            values = np.array(values, dtype=float)
+            values = values[~np.isnan(values)]
+            summary[column] = {label: (float(np.percentile(values, q)) if len(values) > 0 else None) for label, q in PERCENTILES.items()}
+        return summary
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+        self.file.close()
+        summary = self.summary()
+        if self.summary_path != None:
+            with open(self.summary_path, 'w') as f:
+                json.dump(summary, f, indent=2)
+        lines = [f'{column}: ' + ', '.join(f'{label}={value:.2f}' for label, value in summary[column].items() if value != None) for column in TIMING_COLUMNS + [MEMORY_COLUMN]]
+        LOGGER.info(f'timing of {summary["submissions"]} submissions ({summary["timeouts"]} timed out):\n' + '\n'.join(lines))
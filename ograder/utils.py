@@ -1,4 +1,5 @@
 import itertools
+import os
 from typing import Any
 
 def peek(iterable) -> Any:
@@ -10,4 +11,12 @@ def peek(iterable) -> Any:
 
 def is_empty(iterable) -> bool:
     element, _ =  peek(iterable)
-    return element == None
\ No newline at end of file
+    return element == None
+
+def cpu_count() -> int:
+    """
+    Returns the number of cores this process is allowed to run on (respecting the CPU affinity if the platform supports it).
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
@@ -0,0 +1,247 @@
+import cProfile
+import importlib
+import multiprocessing
+import os
+import time
+
+from multiprocessing.connection import wait
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator
+
+from otter.utils import loggers
+
+from .defaults import DEFAULT_MAX_TASKS_PER_WORKER
+
+LOGGER = loggers.get_logger(__name__)
+
+PRELOAD_MODULES = ['otter.api']
+
+class WorkerTimeout(Exception):
+    """Raised (returned) if a task exceeds its time limit and its worker had to be killed."""
+    pass
+
+class WorkerCrash(Exception):
+    """Raised (returned) if a worker exits while it is working on a task."""
+    pass
+
+def _work(conn, func: Callable, preload: list[str], profile_dir: str=None) -> None:
+    """
+    Main loop of a worker process: imports the preload modules once and then runs func for every task it receives until it receives None.
+    If profile_dir is given, each task is profiled and its statistics are written to profile_dir/task_<key>.pstats.
+    """
+    start = time.perf_counter()
+    for module in preload:
+        importlib.import_module(module)
+    conn.send(('ready', time.perf_counter() - start))
+    while True:
+        task = conn.recv()
+        if task == None:
+            break
+        key, args = task
+        profile = cProfile.Profile() if profile_dir != None else None
+        try:
+            if profile != None:
+                profile.enable()
+            result = func(*args)
+        except Exception as e:
+            result = e
+        finally:
+            if profile != None:
+                profile.disable()
+                name = '_'.join(str(k) for k in key) if isinstance(key, tuple) else key
+                profile.dump_stats(os.path.join(profile_dir, f'task_{name}.pstats'))
+        try:
+            conn.send(('done', key, result, time.time()))
+        except Exception as e:
+            # the result (most likely an exception) could not be pickled
+            conn.send(('done', key, RuntimeError(repr(result)), time.time()))
+    conn.close()
+
+@dataclass
+class TaskStats():
+    """Measurements of a single task taken by the pool."""
+    wall_seconds: float # from sending the task to the worker until its result is received
+    transfer_seconds: float = float('nan') # sending the result back to the pool, i.e., pickling, pipe and unpickling
+    timed_out: bool = False
+
+@dataclass
+class _Worker():
+    process: Any
+    conn: Any
+    started: float
+    ready: bool = False
+    tasks: int = 0
+    key: Any = None
+    deadline: float = None
+    dispatched: float = None
+
+class WorkerPool:
+
+    def __init__(self, func: Callable, processes: int, max_tasks_per_worker: int=DEFAULT_MAX_TASKS_PER_WORKER, preload: list[str]=PRELOAD_MODULES, start_method: str=None, profile_dir: str=None):
+        """
+        A pool of long-lived worker processes which execute func for each task.
+        The workers import the preload modules once (forkserver) or inherit them (fork) such that a task does not pay for the interpreter startup.
+        A worker is recycled after it completed max_tasks_per_worker tasks or if it got killed because a task timed out.
+
+        Args:
+            func (Callable): module level function that is executed for each task, its return value has to be picklable
+            processes (int): maximum number of worker processes
+            max_tasks_per_worker (int, optional): number of tasks after which a worker is replaced by a fresh one, None means never
+            preload (list[str], optional): modules which are imported before the first task is executed
+            start_method (str, optional): multiprocessing start method, defaults to forkserver if it is available and fork otherwise
+            profile_dir (str, optional): if given, every task is profiled and its statistics are written to this directory
+        """
+        if start_method == None:
+            methods = multiprocessing.get_all_start_methods()
+            start_method = 'forkserver' if 'forkserver' in methods else ('fork' if 'fork' in methods else 'spawn')
+        self.context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            self.context.set_forkserver_preload(preload)
+        self.func = func
+        self.processes = max(1, processes)
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.preload = preload
+        self.profile_dir = profile_dir
+        self.workers: list[_Worker] = []
+        self.startup_seconds: list[float] = []
+        self.tasks_done = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __start_worker(self) -> _Worker:
+        started = time.perf_counter()
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(target=_work, args=(child_conn, self.func, self.preload, self.profile_dir), daemon=True)
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn, started)
+        self.workers.append(worker)
+        return worker
+
+    def __stop_worker(self, worker: _Worker, kill=False) -> None:
+        self.workers.remove(worker)
+        if kill:
+            worker.process.kill()
+        else:
+            try:
+                worker.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        worker.process.join()
+        worker.conn.close()
+
+    def run(self, tasks: Iterable[tuple[Any, tuple]], timeout: float=None, slow: set=None, slow_workers: int=None) -> Iterator[tuple[Any, Any, TaskStats]]:
+        """
+        Executes all tasks and yields (key, result, stats) triples in the order in which the tasks finish.
+        The result is the return value of func or an exception, i.e., WorkerTimeout if the task took longer than timeout seconds,
+        WorkerCrash if the worker died or the exception raised by func. stats (TaskStats) contains the time measurements of the pool.
+        Tasks are started in the given order, except for the slow tasks: they form a separate lane which occupies at most slow_workers workers
+        as long as there are other tasks left.
+
+        Args:
+            tasks (Iterable[tuple[Any, tuple]]): (key, args) pairs, func is called by func(*args)
+            timeout (float, optional): time after a task will be terminated (by killing its worker)
+            slow (set, optional): keys of the tasks which are likely to hit the timeout
+            slow_workers (int, optional): number of workers of the slow lane, defaults to 1 if the pool has more than one worker and 0 otherwise
+
+        Yields:
+            Iterator[tuple[Any, Any, TaskStats]]: (key, result, stats) triples
+        """
+        tasks = list(tasks)
+        slow = set() if slow == None else slow
+        if slow_workers == None:
+            slow_workers = 1 if self.processes > 1 else 0
+        pending = [task for task in reversed(tasks) if task[0] not in slow]
+        pending_slow = [task for task in reversed(tasks) if task[0] in slow]
+        while len(pending) > 0 or len(pending_slow) > 0 or any(worker.key != None for worker in self.workers):
+            busy = sum(1 for worker in self.workers if worker.key != None)
+            while len(self.workers) < min(self.processes, busy + len(pending) + len(pending_slow)):
+                self.__start_worker()
+
+            for worker in self.workers:
+                if worker.ready and worker.key == None and len(pending) + len(pending_slow) > 0:
+                    busy_slow = sum(1 for w in self.workers if w.key != None and w.key in slow)
+                    if len(pending_slow) > 0 and (busy_slow < slow_workers or len(pending) == 0):
+                        worker.key, args = pending_slow.pop()
+                    else:
+                        worker.key, args = pending.pop()
+                    worker.dispatched = time.monotonic()
+                    worker.deadline = None if timeout == None else worker.dispatched + timeout
+                    worker.conn.send((worker.key, args))
+
+            deadlines = [worker.deadline for worker in self.workers if worker.key != None and worker.deadline != None]
+            wait_timeout = None if len(deadlines) == 0 else max(0, min(deadlines) - time.monotonic())
+            ready = wait([worker.conn for worker in self.workers] + [worker.process.sentinel for worker in self.workers], timeout=wait_timeout)
+
+            for worker in list(self.workers):
+                if worker.conn in ready:
+                    try:
+                        message = worker.conn.recv()
+                    except EOFError:
+                        message = None
+
+                    if message == None:
+                        key = worker.key
+                        self.__stop_worker(worker, kill=True)
+                        if not worker.ready:
+                            raise RuntimeError(f'worker exited with code {worker.process.exitcode} during its startup')
+                        if key != None:
+                            yield key, WorkerCrash(f'worker exited with code {worker.process.exitcode} while working on {key}'), TaskStats(time.monotonic() - worker.dispatched)
+                    elif message[0] == 'ready':
+                        worker.ready = True
+                        self.startup_seconds.append(time.perf_counter() - worker.started)
+                    else:
+                        _, key, result, sent = message
+                        stats = TaskStats(time.monotonic() - worker.dispatched, max(0.0, time.time() - sent))
+                        worker.key = None
+                        worker.deadline = None
+                        worker.tasks += 1
+                        self.tasks_done += 1
+                        if self.max_tasks_per_worker != None and worker.tasks >= self.max_tasks_per_worker:
+                            self.__stop_worker(worker)
+                        yield key, result, stats
+                elif worker.process.sentinel in ready:
+                    key = worker.key
+                    self.__stop_worker(worker, kill=True)
+                    if not worker.ready:
+                        raise RuntimeError(f'worker exited with code {worker.process.exitcode} during its startup')
+                    if key != None:
+                        yield key, WorkerCrash(f'worker exited with code {worker.process.exitcode} while working on {key}'), TaskStats(time.monotonic() - worker.dispatched)
+                elif worker.key != None and worker.deadline != None and time.monotonic() >= worker.deadline:
+                    key = worker.key
+                    self.__stop_worker(worker, kill=True)
+                    self.tasks_done += 1
+                    yield key, WorkerTimeout(f'{key} timed out after {timeout} seconds'), TaskStats(time.monotonic() - worker.dispatched, timed_out=True)
+
+    def close(self) -> None:
+        """
+        Stops all workers.
+        """
+        for worker in list(self.workers):
+            self.__stop_worker(worker, kill=worker.key != None)
+
+    def status(self) -> list[tuple[str, Any, float]]:
+        """
+        Returns:
+            list[tuple[str, Any, float]]: for each worker its name (process id), the key of its task (None if it is idle) and the seconds it has been working on it
+        """
+        now = time.monotonic()
+        return [(str(worker.process.pid), worker.key, (now - worker.dispatched) if worker.key != None else 0.0) for worker in list(self.workers)]
+
+    def saved_startup_seconds(self) -> float:
+        """
+        Estimates the startup time saved compared to starting a fresh worker for each task.
+        The first worker pays for the import of the preload modules, therefore its startup time is used as the cost of a cold start.
+        """
+        if len(self.startup_seconds) == 0:
+            return 0.0
+        cold_start = max(self.startup_seconds)
+        return max(0.0, cold_start * self.tasks_done - sum(self.startup_seconds))
+
+    def summary(self) -> str:
+        return (f'{len(self.startup_seconds)} worker(s) executed {self.tasks_done} task(s), '
+                f'spent {sum(self.startup_seconds):.2f}s starting workers and saved about {self.saved_startup_seconds():.2f}s of startup time')
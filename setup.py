@@ -6,6 +6,8 @@ packages = \
 
 install_requires = ['pyyaml', 'fica', 'nbformat', 'click', 'otter-grader', 'pandas', 'numpy', 'matplotlib']
 
+extras_require = {'parquet': ['pyarrow'], 'monitor': ['psutil']}
+
 package_data = \
     {'': ['*']}
 
@@ -26,6 +28,7 @@ setup_kwargs = {
     ''',
     'packages': packages,
     'install_requires': install_requires,
+    'extras_require': extras_require,
     'python_requires': '>=3.7.0,<4.0.0',
     'keywords': keywords
 }